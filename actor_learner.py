@@ -0,0 +1,149 @@
+import multiprocessing
+import queue
+import numpy as np
+import connect
+import qlearning
+import utils
+
+# Arrays of a batch of transitions, in the order of ReplayBuffer.add_batch
+TRANSITION_FIELDS = ('states', 'symm_states', 'actions', 'rewards', 'next_states', 'next_symm_states', 'dones',
+                     'next_available')
+
+def latest(snapshots):
+    '''Returns the newest snapshot waiting in the queue (None if there is none)'''
+    snapshot = None
+    while True:
+        try:
+            snapshot = snapshots.get_nowait()
+        except queue.Empty:
+            return snapshot
+
+def send(transitions, batch, stop):
+    '''Puts batch on the transitions queue, giving up once stop is set'''
+    while not stop.is_set():
+        try:
+            transitions.put(batch, timeout=0.1)
+            return
+        except queue.Full:
+            pass
+
+def receive(transitions, processes):
+    '''Takes the next batch off the transitions queue, raising RuntimeError once no actor is left to send one'''
+    while True:
+        try:
+            return transitions.get(timeout=1)
+        except queue.Empty:
+            if not any(process.is_alive() for process in processes):
+                raise RuntimeError("All actor processes have exited (exit codes %s)." %
+                                   ", ".join(str(process.exitcode) for process in processes))
+
+def run_actor(seed, board, epsilon, q_table, send_every, transitions, snapshots, stop):
+    '''Plays episodes with the latest snapshot of the learner's Q-table and ships its transitions in batches'''
+    np.random.seed(seed)
+    env = board(verbose=False)
+    opponent = qlearning.RandomAgent(environment=env)
+    agent = qlearning.LearningAgent(environment=env, epsilon=epsilon, q_table=q_table)
+    batch = {field: [] for field in TRANSITION_FIELDS}
+
+    while not stop.is_set():
+        # Switch to newest published Q-table between episodes
+        snapshot = latest(snapshots)
+        if snapshot is not None:
+            agent.Q.set_state(snapshot)
+
+        # Opponent takes first turn
+        env.reset(first_player='o')
+        env.act(action = opponent.choose_move())
+
+        # Play episode as in qlearning.play, recording transitions instead of learning
+        while not env.is_terminal:
+            env.change_turn()
+            state_t = (env.key, env.mirror_key)
+            action_t = agent.choose_move()
+            env.act(action = action_t)
+
+            if env.winner is not None:
+                reward = 1
+            elif env.is_draw:
+                reward = 0
+            else:
+                env.change_turn()
+                env.act(action = opponent.choose_move())
+                reward = -1 if env.winner is not None else 0
+
+            next_available = np.zeros(env.num_cols, dtype=bool)
+            next_available[env.available_actions] = True
+            for field, value in zip(TRANSITION_FIELDS, [state_t[0], state_t[1], action_t, reward, env.key,
+                                                        env.mirror_key, env.is_terminal, next_available]):
+                batch[field].append(value)
+
+        if len(batch['actions']) >= send_every:
+            send(transitions, {field: np.array(values) for field, values in batch.items()}, stop)
+            batch = {field: [] for field in TRANSITION_FIELDS}
+
+    # Transitions still buffered for the learner are no longer needed, so do not wait for them on exit
+    transitions.cancel_join_thread()
+
+def publish(agent, snapshot_queues):
+    '''Sends the current Q-table of agent to every actor'''
+    snapshot = agent.Q.get_state()
+    for snapshots in snapshot_queues:
+        snapshots.put(snapshot)
+
+def play_parallel(max_steps=30000, actors=2, n=1000, board=connect.Connect, q_table='dict', epsilon=0.2,
+                  send_every=100, publish_every=1000, replay_capacity=None, batch_size=32, updates_per_step=1,
+                  seed=None, exact=False):
+    '''Trains one agent in this process on transitions from actor processes, each playing with a snapshot of its Q-table'''
+    # Setup learner, with a random agent as baseline for evaluations
+    env = board(verbose=False)
+    agent = qlearning.LearningAgent(environment=env, epsilon=epsilon, q_table=q_table, replay_capacity=replay_capacity,
+                                    batch_size=batch_size, updates_per_step=updates_per_step)
+    opponent = qlearning.RandomAgent(environment=env)
+
+    # Bounded transitions queue, so actors wait for a learner that falls behind
+    transitions = multiprocessing.Queue(maxsize=4 * actors)
+    snapshot_queues = [multiprocessing.Queue() for _ in range(actors)]
+    stop = multiprocessing.Event()
+    processes = [multiprocessing.Process(target=run_actor, daemon=True,
+                                         args=(actor_seed, board, epsilon, q_table, send_every, transitions,
+                                               snapshots, stop))
+                 for actor_seed, snapshots in zip(utils.seeds(seed, actors), snapshot_queues)]
+    publish(agent, snapshot_queues)
+    for process in processes:
+        process.start()
+
+    steps = 0
+    last_publish = 0
+    next_evaluation = 0
+    try:
+        while steps <= max_steps:
+            # Apply next batch of transitions
+            batch = receive(transitions, processes)
+            if agent.replay is None:
+                agent.learn_transitions(**batch)
+            else:
+                agent.replay.add_batch(**batch)
+                agent.learn_from_replay(len(batch['actions']))
+            steps += len(batch['actions'])
+
+            if steps - last_publish >= publish_every:
+                publish(agent, snapshot_queues)
+                last_publish = steps
+
+            # Play policy evaluations every n steps, as in qlearning.play
+            while next_evaluation <= min(steps, max_steps):
+                agent = qlearning.test(agent, episodes=10, board=board, exact=exact)
+                opponent = qlearning.test(opponent, episodes=10, board=board, exact=exact)
+                next_evaluation += n
+    finally:
+        stop.set()
+        # Keep emptying the queue so no actor stays blocked on it
+        for process in processes:
+            while process.is_alive():
+                latest(transitions)
+                process.join(timeout=0.1)
+        for snapshots in snapshot_queues:
+            snapshots.cancel_join_thread()
+
+    agent.opponent_rewards = opponent.rewards
+    return agent
@@ -0,0 +1,315 @@
+import argparse
+import functools
+import json
+import platform
+import time
+import tracemalloc
+import numpy as np
+import connect
+import expectiminimax
+import minimax
+import qlearning
+import utils
+
+DEFAULT_SIZES = ((5, 3, 3), (7, 6, 4), (9, 7, 5), (12, 10, 6))
+# Full solves and training runs blow up quickly, so they default to small boards
+SMALL_SIZES = ((4, 3, 3), (5, 3, 3))
+# Move orderings compared by the search benchmark
+ORDERINGS = (minimax.ColumnOrdering, minimax.CenterOrdering, minimax.KillerHistoryOrdering)
+
+
+def legacy_was_winning_move(env):
+    """
+    The slicing win check Connect.was_winning_move used before it counted runs, kept as a baseline
+
+    Searches the row and column windows and both full diagonals through the last disk with
+    utils.search_sequence_numpy.
+    """
+    action_row = env.lowest_free_rows[env.last_action] - 1
+    action_col = env.last_action
+    winning_sequence = np.full(shape=env.num_connect, fill_value=env.player_at_turn)
+
+    row_candidates = env.grid[action_row, max(0, action_col - env.num_connect + 1): min(env.num_cols, action_col + env.num_connect)]
+    if utils.search_sequence_numpy(row_candidates, winning_sequence):
+        return True
+    col_candidates = env.grid[max(0, action_row - env.num_connect + 1): min(env.num_rows, action_row + env.num_connect), action_col]
+    if utils.search_sequence_numpy(col_candidates, winning_sequence):
+        return True
+    diag_up_candidates = np.diagonal(env.grid, action_col - action_row)
+    if len(diag_up_candidates) >= env.num_connect and utils.search_sequence_numpy(diag_up_candidates, winning_sequence):
+        return True
+    diag_down_candidates = np.diagonal(env.grid[::-1], action_row + action_col - (env.num_rows - 1))
+    if len(diag_down_candidates) >= env.num_connect and utils.search_sequence_numpy(diag_down_candidates, winning_sequence):
+        return True
+    return False
+
+
+def random_positions(num_cols, num_rows, num_connect, num_positions, seed=0):
+    """
+    Play random games and return the moves leading to num_positions positions, each just after a move that did not end the game
+    """
+    np.random.seed(seed)
+    board = connect.Connect(num_cols, num_rows, num_connect, verbose=False)
+    positions = []
+    while len(positions) < num_positions:
+        board.reset(first_player='o')
+        actions = []
+        while len(positions) < num_positions:
+            action = np.random.choice(board.available_actions)
+            board.act(action)
+            actions.append(action)
+            if board.is_terminal:
+                break
+            positions.append(list(actions))
+            board.change_turn()
+    return positions
+
+
+def random_games(num_cols, num_rows, num_connect, num_games, seed=0):
+    """
+    Play random games to the end and return the moves of each, 'o' moving first
+    """
+    np.random.seed(seed)
+    board = connect.Connect(num_cols, num_rows, num_connect, verbose=False)
+    games = []
+    for _ in range(num_games):
+        board.reset(first_player='o')
+        actions = []
+        while not board.is_terminal:
+            if actions:
+                board.change_turn()
+            action = np.random.choice(board.available_actions)
+            board.act(action)
+            actions.append(action)
+        games.append(actions)
+    return games
+
+
+def replay(board, actions):
+    """
+    Reset board and play actions on it, 'o' moving first
+    """
+    board.reset(first_player='o')
+    for i, action in enumerate(actions):
+        if i > 0:
+            board.change_turn()
+        board.act(action)
+    return board
+
+
+def time_per_call(function, repeats):
+    """
+    Return the mean wall time in seconds of calling function repeats times
+    """
+    start = time.perf_counter()
+    for _ in range(repeats):
+        function()
+    return (time.perf_counter() - start) / repeats
+
+
+def timed(function):
+    """
+    Call function once and return its result and the wall time in seconds
+    """
+    start = time.perf_counter()
+    result = function()
+    return result, time.perf_counter() - start
+
+
+def traced(function):
+    """
+    Call function once under tracemalloc and return its result, the memory (in bytes) still held afterwards
+    by what it allocated and the peak memory while it ran
+    """
+    tracemalloc.start()
+    try:
+        result = function()
+        current, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    return result, current, peak
+
+
+def size_result(num_cols, num_rows, num_connect, **metrics):
+    result = {'num_cols': num_cols, 'num_rows': num_rows, 'num_connect': num_connect}
+    result.update(metrics)
+    return result
+
+
+def bench_win_check(sizes=DEFAULT_SIZES, num_positions=200, repeats=20):
+    """
+    Compare the legacy slicing win check with run counting (uncached, and cached by act) and the BitConnect shifts
+
+    :return: a list with one dict per (num_cols, num_rows, num_connect) size, holding microseconds per check
+    """
+    results = []
+    for num_cols, num_rows, num_connect in sizes:
+        timings = {'legacy': 0.0, 'run_counting': 0.0, 'cached': 0.0, 'bitboard': 0.0}
+        for actions in random_positions(num_cols, num_rows, num_connect, num_positions):
+            board = replay(connect.Connect(num_cols, num_rows, num_connect, verbose=False), actions)
+            bit_board = replay(connect.BitConnect(num_cols, num_rows, num_connect, verbose=False), actions)
+            timings['legacy'] += time_per_call(lambda: legacy_was_winning_move(board), repeats)
+            timings['run_counting'] += time_per_call(board.check_last_move, repeats)
+            timings['cached'] += time_per_call(board.was_winning_move, repeats)
+            timings['bitboard'] += time_per_call(bit_board.check_last_move, repeats)
+
+        results.append(size_result(num_cols, num_rows, num_connect,
+                                   **{name + '_us': 1e6 * total / num_positions for name, total in timings.items()}))
+    return results
+
+
+def bench_act(sizes=DEFAULT_SIZES, num_games=200, seed=0):
+    """
+    Measure moves per second of act followed by was_winning_move, replaying the same random games on Connect and BitConnect
+
+    :return: a list with one dict per size
+    """
+    results = []
+    for num_cols, num_rows, num_connect in sizes:
+        games = random_games(num_cols, num_rows, num_connect, num_games, seed)
+        num_moves = sum(len(actions) for actions in games)
+        result = size_result(num_cols, num_rows, num_connect, moves=num_moves)
+        for name, board_class in [('connect', connect.Connect), ('bitconnect', connect.BitConnect)]:
+            board = board_class(num_cols, num_rows, num_connect, verbose=False)
+
+            def play_games():
+                for actions in games:
+                    board.reset(first_player='o')
+                    for i, action in enumerate(actions):
+                        if i > 0:
+                            board.change_turn()
+                        board.act(action)
+                        board.was_winning_move()
+
+            _, seconds = timed(play_games)
+            result[name + '_moves_per_sec'] = num_moves / seconds
+        results.append(result)
+    return results
+
+
+def full_solve(agent_class, num_cols, num_rows, num_connect, ordering=None):
+    """
+    Search the whole game from the empty board with 'o' moving first, and return the agent and the value for 'x'
+
+    :param ordering: move ordering class of a MinmaxAgent (the agent's default if None)
+    """
+    board = connect.Connect(num_cols, num_rows, num_connect, verbose=False)
+    # The search changes turn before every move, so start with 'x' at turn to let 'o' play first
+    board.reset(first_player='x')
+    agent = agent_class(board) if ordering is None else agent_class(board, ordering=ordering(board))
+    if agent.stochastic:
+        value = agent.expectiminimax(board, False)
+    else:
+        value = agent.minimax(board, -1, +1, False)
+    return agent, value
+
+
+def bench_search(sizes=SMALL_SIZES, agent_classes=(minimax.MinmaxAgent, expectiminimax.StochasticMinmaxAgent),
+                 orderings=ORDERINGS, memory=True):
+    """
+    Measure full-solve time, nodes expanded and transposition table size of the search agents
+
+    Agents with a move ordering (MinmaxAgent) solve once per ordering class in orderings, so the node counts show
+    how much each ordering prunes. With memory, every solve is repeated under tracemalloc to record the memory held
+    by the table and the peak.
+
+    :return: a list with one dict per size, agent class and ordering (None for agents without one)
+    """
+    results = []
+    for num_cols, num_rows, num_connect in sizes:
+        for agent_class in agent_classes:
+            for ordering in orderings if issubclass(agent_class, minimax.MinmaxAgent) else [None]:
+                solve = functools.partial(full_solve, agent_class, num_cols, num_rows, num_connect, ordering)
+                (agent, value), seconds = timed(solve)
+                result = size_result(num_cols, num_rows, num_connect, agent=agent_class.__name__,
+                                     ordering=None if ordering is None else ordering.__name__, value=value,
+                                     seconds=seconds, nodes=agent.nodes, nodes_per_sec=agent.nodes / seconds,
+                                     table_entries=len(agent.policy))
+                if memory:
+                    _, result['table_bytes'], result['peak_bytes'] = traced(solve)
+                results.append(result)
+    return results
+
+
+def bench_play(sizes=SMALL_SIZES, max_steps=10000, q_tables=('dict', 'dense'), seed=0, memory=True):
+    """
+    Measure qlearning.play steps per second (including its periodic test episodes) and Q-table size
+
+    With memory, every run is repeated under tracemalloc to record the memory held by the agent and the peak.
+
+    :return: a list with one dict per size and Q-table backend
+    """
+    results = []
+    for num_cols, num_rows, num_connect in sizes:
+        board = functools.partial(connect.Connect, num_cols, num_rows, num_connect)
+        for q_table in q_tables:
+            def train():
+                np.random.seed(seed)
+                return qlearning.play(max_steps=max_steps, board=board, q_table=q_table)
+
+            agent, seconds = timed(train)
+            result = size_result(num_cols, num_rows, num_connect, q_table=q_table, steps=max_steps,
+                                 seconds=seconds, steps_per_sec=max_steps / seconds, table_entries=len(agent.Q))
+            if memory:
+                _, result['table_bytes'], result['peak_bytes'] = traced(train)
+            results.append(result)
+    return results
+
+
+def parse_size(text):
+    """
+    Parse a board size given as COLSxROWSxCONNECT, e.g. 5x3x3
+    """
+    try:
+        num_cols, num_rows, num_connect = (int(part) for part in text.lower().split('x'))
+    except ValueError:
+        raise argparse.ArgumentTypeError("Board sizes have to be given as COLSxROWSxCONNECT, e.g. 5x3x3.")
+    return num_cols, num_rows, num_connect
+
+
+SUITES = ('win_check', 'act', 'search', 'play')
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Benchmark the Connect boards, search agents and Q-learning.")
+    parser.add_argument('--suites', nargs='+', choices=SUITES, default=SUITES, help="benchmarks to run (all by default)")
+    parser.add_argument('--sizes', type=parse_size, nargs='+',
+                        help="board sizes as COLSxROWSxCONNECT (defaults depend on the benchmark)")
+    parser.add_argument('--positions', type=int, default=200)
+    parser.add_argument('--repeats', type=int, default=20)
+    parser.add_argument('--games', type=int, default=200)
+    parser.add_argument('--steps', type=int, default=10000)
+    parser.add_argument('--no-memory', dest='memory', action='store_false',
+                        help="skip the tracemalloc reruns of the search and play benchmarks")
+    parser.add_argument('--output', help="write the results as JSON to this file")
+    args = parser.parse_args()
+
+    results = {}
+    if 'win_check' in args.suites:
+        results['win_check'] = bench_win_check(args.sizes or DEFAULT_SIZES, args.positions, args.repeats)
+        for result in results['win_check']:
+            print("win check %(num_cols)dx%(num_rows)d connect %(num_connect)d: legacy %(legacy_us).2fus, "
+                  "run counting %(run_counting_us).2fus, cached %(cached_us).2fus, bitboard %(bitboard_us).2fus"
+                  % result)
+    if 'act' in args.suites:
+        results['act'] = bench_act(args.sizes or DEFAULT_SIZES, args.games)
+        for result in results['act']:
+            print("act %(num_cols)dx%(num_rows)d connect %(num_connect)d: Connect %(connect_moves_per_sec).0f "
+                  "moves/s, BitConnect %(bitconnect_moves_per_sec).0f moves/s" % result)
+    if 'search' in args.suites:
+        results['search'] = bench_search(args.sizes or SMALL_SIZES, memory=args.memory)
+        for result in results['search']:
+            ordering = "" if result['ordering'] is None else " " + result['ordering']
+            print(("search %(num_cols)dx%(num_rows)d connect %(num_connect)d %(agent)s" + ordering +
+                   ": %(seconds).2fs, %(nodes)d nodes (%(nodes_per_sec).0f/s), %(table_entries)d entries") % result)
+    if 'play' in args.suites:
+        results['play'] = bench_play(args.sizes or SMALL_SIZES, args.steps, memory=args.memory)
+        for result in results['play']:
+            print("play %(num_cols)dx%(num_rows)d connect %(num_connect)d %(q_table)s: %(steps_per_sec).0f steps/s, "
+                  "%(table_entries)d entries" % result)
+
+    if args.output is not None:
+        report = {'time': time.strftime('%Y-%m-%dT%H:%M:%S'), 'python': platform.python_version(),
+                  'numpy': np.__version__, 'machine': platform.machine(), 'results': results}
+        with open(args.output, 'w') as f:
+            json.dump(report, f, indent=2, default=float)
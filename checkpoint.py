@@ -0,0 +1,80 @@
+import json
+import os
+import time
+import numpy as np
+
+
+def save_checkpoint(path, agent, opponent, steps):
+    """
+    Write the training state of qlearning.play to a compressed .npz file
+
+    Stores the Q-table (and replay buffer) of agent, the reward curves of agent and opponent, the number of steps taken and the
+    state of the global numpy RNG, so a resumed run continues exactly where this one stopped. The file is
+    written next to path first and then moved into place, so a crash never leaves a half-written checkpoint.
+    """
+    arrays = {'steps': np.array(steps),
+              'rewards': np.array(agent.rewards),
+              'opponent_rewards': np.array(opponent.rewards)}
+    for name, value in agent.Q.get_state().items():
+        arrays['q_' + name] = value
+    if agent.replay is not None:
+        for name, value in agent.replay.get_state().items():
+            arrays['replay_' + name] = value
+        arrays['update_credit'] = np.array(agent.update_credit)
+
+    kind, rng_keys, rng_pos, rng_has_gauss, rng_cached_gaussian = np.random.get_state()
+    arrays.update(rng_keys=rng_keys, rng_state=np.array([rng_pos, rng_has_gauss]),
+                  rng_cached_gaussian=np.array(rng_cached_gaussian))
+
+    temporary_path = path + '.tmp'
+    with open(temporary_path, 'wb') as f:
+        np.savez_compressed(f, **arrays)
+    os.replace(temporary_path, path)
+
+
+def load_checkpoint(path, agent, opponent):
+    """
+    Restore a checkpoint written by save_checkpoint into agent, opponent and the global numpy RNG
+
+    :return: the number of steps taken when the checkpoint was written
+    """
+    with np.load(path) as arrays:
+        agent.Q.set_state({name[2:]: arrays[name] for name in arrays.files if name.startswith('q_')})
+        if agent.replay is not None:
+            agent.replay.set_state({name[7:]: arrays[name] for name in arrays.files if name.startswith('replay_')})
+            agent.update_credit = float(arrays['update_credit'])
+        agent.rewards = arrays['rewards'].tolist()
+        opponent.rewards = arrays['opponent_rewards'].tolist()
+        rng_pos, rng_has_gauss = arrays['rng_state']
+        np.random.set_state(('MT19937', arrays['rng_keys'], int(rng_pos), int(rng_has_gauss),
+                             float(arrays['rng_cached_gaussian'])))
+        return int(arrays['steps'])
+
+
+class TelemetryLog:
+    def __init__(self, path):
+        """
+        Append-only JSON lines log of training metrics
+
+        Every record is flushed straight away, so a long run can be followed (or its remains read) while it goes.
+        Steps per second are measured since the previous record.
+        """
+        self.path = path
+        self.start_time = time.perf_counter()
+        self.last_time = self.start_time
+        self.last_steps = None
+
+    def write(self, steps, **metrics):
+        """
+        Append one record with the step count, wall time, steps per second and the given metrics
+        """
+        now = time.perf_counter()
+        record = {'steps': steps, 'wall_time': now - self.start_time}
+        if self.last_steps is not None and now > self.last_time:
+            record['steps_per_sec'] = (steps - self.last_steps) / (now - self.last_time)
+        record.update(metrics)
+        self.last_time = now
+        self.last_steps = steps
+
+        with open(self.path, 'a') as f:
+            f.write(json.dumps(record) + '\n')
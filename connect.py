@@ -16,6 +16,9 @@ class Connect:
         self.players = ['o', 'x']
         self.other_player = {'o': 'x', 'x': 'o'}
 
+        # Amounts each disk adds to the integer state key and to the key of the mirrored board
+        self.key_weights, self.mirror_key_weights = utils.key_weights(num_cols, num_rows, self.players)
+
     def reset(self, first_player='random'):
         self.grid = np.full(fill_value=" ", shape=(self.num_rows, self.num_cols), dtype=str)
 
@@ -34,6 +37,20 @@ class Connect:
 
         # Keep track of the last action played (simplifies checking for terminal states).
         self.last_action = None
+        self.num_moves = 0
+
+        # Terminal status, computed once per move by act: the player who won (None if nobody has), whether the
+        # game is over and whether it ended in a draw
+        self.winner = None
+        self.is_terminal = False
+        self.is_draw = False
+
+        # Previous last_action, moving player and winner of every act, so moves can be taken back with undo
+        self.history = []
+
+        # Integer (base-3) keys of the board and of its left-right mirror image, updated on every move
+        self.key = 0
+        self.mirror_key = 0
 
         self.game_over = False
         if self.verbose:
@@ -49,25 +66,63 @@ class Connect:
 
         :param action: an integer referring to the column index where a new token/disk should be dropped
         """
-        self.grid[self.lowest_free_rows[action], action] = self.player_at_turn
+        self.history.append((self.last_action, self.player_at_turn, self.winner))
+        row = self.lowest_free_rows[action]
+        self.grid[row, action] = self.player_at_turn
+        self.key += self.key_weights[self.player_at_turn][row][action]
+        self.mirror_key += self.mirror_key_weights[self.player_at_turn][row][action]
         self.lowest_free_rows[action] += 1
         if self.lowest_free_rows[action] == self.num_rows:
             self.available_actions = np.setdiff1d(self.available_actions, action)
         self.last_action = action
+        self.num_moves += 1
+
+        # Store terminal status of the new board
+        if self.check_last_move():
+            self.winner = self.player_at_turn
+        self.is_draw = self.winner is None and self.num_moves == self.num_rows * self.num_cols
+        self.is_terminal = self.winner is not None or self.is_draw
+
+        if self.verbose:
+            print(self.grid[::-1, ])
+            if self.winner is not None:
+                print("Player '", self.winner, "' has won the game!")
+
+    def undo(self, action):
+        """
+        Take back the last move in place, restoring the board to the state just before act(action)
+
+        The grid, lowest_free_rows, available_actions, last_action, player_at_turn and terminal status are all
+        restored, which lets a search walk the game tree on a single board instead of copying it for every child.
+
+        :param action: the column index of the last action played
+        """
+        self.last_action, self.player_at_turn, self.winner = self.history.pop()
+        if self.lowest_free_rows[action] == self.num_rows:
+            index = np.searchsorted(self.available_actions, action)
+            self.available_actions = np.insert(self.available_actions, index, action)
+        self.lowest_free_rows[action] -= 1
+        row = self.lowest_free_rows[action]
+        self.grid[row, action] = " "
+        self.key -= self.key_weights[self.player_at_turn][row][action]
+        self.mirror_key -= self.mirror_key_weights[self.player_at_turn][row][action]
+        self.num_moves -= 1
+        self.is_draw = False
+        self.is_terminal = self.winner is not None
 
         if self.verbose:
             print(self.grid[::-1, ])
 
     def grid_is_full(self):
-        return np.all(self.lowest_free_rows == self.num_rows)
+        return self.num_moves == self.num_rows * self.num_cols
 
     def was_winning_move(self):
         """
         Check if the move that has just been made wins the game.
 
-        Determine in which row the disk (token) landed using self.last_action and look at that row,
-        column and both diagonals including this token. Check whether there is any sequence of
-        length 'num_connect' of the same token type.
+        Determine in which row the disk (token) landed using self.last_action and count the disks of the
+        same token type next to it, in both directions along its row, column and both diagonals.
+        The game is won if any of these lines holds 'num_connect' disks.
 
         For example, if num_connect == 3
 
@@ -79,40 +134,309 @@ class Connect:
         ' ' ' ' ' ' ' ' ' ' ' ' '
         ' ' ' ' ' ' ' ' ' ' ' ' '
 
-        and "x" is the position the token has dropped, check whether there is a sequence of 'x' of length 3
-        in the corresponding row (r), column (c), upward-diagonal (u), or downward diagonal (d).
+        and "x" is the position the token has dropped, count the 'x' tokens next to it in the corresponding
+        row (r), column (c), upward-diagonal (u), and downward diagonal (d), stopping at the first other token.
+        At most num_connect - 1 cells are looked at in each direction.
+
+        The count is done once by act, which stores the result in self.winner, so calls are free.
 
-        [This function could be made MUCH more efficient by excluding some of the checks beforehand, for
-         example, based on the row height of the last_action.]
+        :return: a boolean, True if the last move was a winning move (of the player at turn)
+        """
+        return self.winner == self.player_at_turn
 
-        :return: a boolean, True if the last move was a winning move
+    def check_last_move(self):
         """
-        game_is_won = False
+        Count the runs through the last disk played (uncached, see was_winning_move)
 
+        :return: a boolean, True if the last disk completes a line of num_connect disks of its player
+        """
         action_row = self.lowest_free_rows[self.last_action] - 1
         action_col = self.last_action
-        winning_sequence = np.full(shape=self.num_connect, fill_value=self.player_at_turn)
+        grid = self.grid
+        token = grid[action_row, action_col]
+
+        for row_step, col_step in ((0, 1), (1, 0), (1, 1), (-1, 1)):
+            count = 1
+            for sign in (1, -1):
+                row = action_row + sign * row_step
+                col = action_col + sign * col_step
+                while (count < self.num_connect and 0 <= row < self.num_rows and 0 <= col < self.num_cols
+                       and grid[row, col] == token):
+                    count += 1
+                    row += sign * row_step
+                    col += sign * col_step
+            if count >= self.num_connect:
+                return True
+        return False
+
+
+class BitConnect:
+    def __init__(self, num_cols=5, num_rows=3, num_connect=3, verbose=True):
+        """
+        Define a new bitboard-backed Connect object
+
+        Exposes the same interface as Connect, but stores the disks of each player as an integer mask.
+        One difference: lowest_free_rows is a plain list rather than an int ndarray (indexing and updating list
+        items is what keeps act and undo fast), so element-wise comparisons such as
+        lowest_free_rows == num_rows need np.asarray(lowest_free_rows) first.
+        Every column takes num_rows + 1 bits (bottom to top); the spare top bit of each column stays
+        empty so that shifted masks cannot wrap a line from one column into the next.
+        """
+
+        self.num_cols = num_cols
+        self.num_rows = num_rows
+        self.num_connect = num_connect
+        self.verbose = verbose
+
+        self.players = ['o', 'x']
+        self.other_player = {'o': 'x', 'x': 'o'}
+
+        # Bit offset between two neighbouring cells for the vertical, horizontal, upward- and
+        # downward-diagonal direction respectively
+        self.height = num_rows + 1
+        self.shifts = (1, self.height, self.height + 1, self.height - 1)
+
+        # Single-bit masks of every cell, indexed [row][col]
+        self.cell_masks = [[1 << (col * self.height + row) for col in range(num_cols)] for row in range(num_rows)]
+
+        # Amounts each disk adds to the integer state key and to the key of the mirrored board (same keys as Connect)
+        self.key_weights, self.mirror_key_weights = utils.key_weights(num_cols, num_rows, self.players)
+
+    def reset(self, first_player='random'):
+        self.masks = {'o': 0, 'x': 0}
+
+        # Each column index is one action.
+        self.available_actions = np.arange(self.num_cols)
+
+        # Keep track of the lowest free row position per column (where a disk would land if dropped in that column),
+        # as a list rather than the ndarray of Connect since its items are read and written on every move
+        self.lowest_free_rows = [0] * self.num_cols
+
+        if first_player == 'random':
+            self.player_at_turn = np.random.choice(self.players)
+        elif first_player in self.players:
+            self.player_at_turn = first_player
+        else:
+            raise ValueError("The argument first_player has to be either 'random', 'x', or 'o'.")
+
+        # Keep track of the last action played (simplifies checking for terminal states).
+        self.last_action = None
+        self.num_moves = 0
+
+        # Terminal status, computed once per move by act: the player who won (None if nobody has), whether the
+        # game is over and whether it ended in a draw
+        self.winner = None
+        self.is_terminal = False
+        self.is_draw = False
+
+        # Previous last_action, moving player and winner of every act, so moves can be taken back with undo
+        self.history = []
+
+        # Integer (base-3) keys of the board and of its left-right mirror image, updated on every move
+        self.key = 0
+        self.mirror_key = 0
+
+        self.game_over = False
+        if self.verbose:
+            print("Game has been reset.")
+            print(self.grid[::-1, ])
+
+    @property
+    def grid(self):
+        """
+        The board in the same (num_rows, num_cols) string layout as Connect.grid
+
+        Built on request from the player masks, so writing into the returned array does not change the board.
+        """
+        grid = np.full(fill_value=" ", shape=(self.num_rows, self.num_cols), dtype=str)
+        for player, mask in self.masks.items():
+            for row in range(self.num_rows):
+                for col in range(self.num_cols):
+                    if mask & self.cell_masks[row][col]:
+                        grid[row, col] = player
+        return grid
+
+    def change_turn(self):
+        self.player_at_turn = self.other_player[self.player_at_turn]
 
-        # Calculate candidate vectors
-        row_candidates = self.grid[action_row, max(0, action_col - self.num_connect + 1) : min(self.num_cols, action_col + self.num_connect)]
-        if utils.search_sequence_numpy(row_candidates, winning_sequence):
-            game_is_won = True
+    def act(self, action):
+        """
+        Given an action (a column index; known to be a valid action!), generate the new board
+
+        :param action: an integer referring to the column index where a new token/disk should be dropped
+        """
+        self.history.append((self.last_action, self.player_at_turn, self.winner))
+        row = self.lowest_free_rows[action]
+        move = self.cell_masks[row][action]
+        self.masks[self.player_at_turn] |= move
+        self.key += self.key_weights[self.player_at_turn][row][action]
+        self.mirror_key += self.mirror_key_weights[self.player_at_turn][row][action]
+        self.lowest_free_rows[action] = row + 1
+        if row + 1 == self.num_rows:
+            self.available_actions = self.available_actions[self.available_actions != action]
+        self.last_action = action
+        self.num_moves += 1
+
+        # Store terminal status of the new board
+        if self.check_last_move():
+            self.winner = self.player_at_turn
+        self.is_draw = self.winner is None and self.num_moves == self.num_rows * self.num_cols
+        self.is_terminal = self.winner is not None or self.is_draw
+
+        if self.verbose:
+            print(self.grid[::-1, ])
+            if self.winner is not None:
+                print("Player '", self.winner, "' has won the game!")
+
+    def undo(self, action):
+        """
+        Take back the last move in place, restoring the board to the state just before act(action)
+
+        :param action: the column index of the last action played
+        """
+        self.last_action, self.player_at_turn, self.winner = self.history.pop()
+        row = self.lowest_free_rows[action] - 1
+        if row + 1 == self.num_rows:
+            index = np.searchsorted(self.available_actions, action)
+            self.available_actions = np.insert(self.available_actions, index, action)
+        self.lowest_free_rows[action] = row
+        self.masks[self.player_at_turn] &= ~self.cell_masks[row][action]
+        self.key -= self.key_weights[self.player_at_turn][row][action]
+        self.mirror_key -= self.mirror_key_weights[self.player_at_turn][row][action]
+        self.num_moves -= 1
+        self.is_draw = False
+        self.is_terminal = self.winner is not None
+
+        if self.verbose:
+            print(self.grid[::-1, ])
+
+    def grid_is_full(self):
+        return self.num_moves == self.num_rows * self.num_cols
+
+    def was_winning_move(self):
+        """
+        Check if the move that has just been made wins the game.
+
+        The check is done once by act (see check_last_move), which stores the result in self.winner.
+
+        :return: a boolean, True if the last move was a winning move (of the player at turn)
+        """
+        return self.winner == self.player_at_turn
+
+    def check_last_move(self):
+        """
+        Check whether the player of the last disk has a line (uncached, see was_winning_move)
+
+        For every direction, repeatedly AND the mask of that player with itself shifted by one cell in that
+        direction. After num_connect - 1 steps a bit is only left set if it starts a line of num_connect disks.
+
+        :return: a boolean, True if the player of the last disk has num_connect disks in a line
+        """
+        row = self.lowest_free_rows[self.last_action] - 1
+        move = self.cell_masks[row][self.last_action]
+        mask = self.masks['o'] if self.masks['o'] & move else self.masks['x']
+        for shift in self.shifts:
+            line = mask
+            for _ in range(self.num_connect - 1):
+                line &= line >> shift
+            if line:
+                return True
+        return False
+
+
+class BatchConnect:
+    def __init__(self, num_envs, num_cols=5, num_rows=3, num_connect=3, first_player='random'):
+        """
+        Define N Connect games that are played in lockstep
+
+        All boards live in one (num_envs, num_rows, num_cols) int8 array holding 0 for an empty cell and
+        1 or 2 for a disk of 'o' or 'x' (the digits of Connect.key). Every step drops one disk on each
+        board for the player at turn, scores all boards with array operations and resets finished games.
+        """
+
+        self.num_envs = num_envs
+        self.num_cols = num_cols
+        self.num_rows = num_rows
+        self.num_connect = num_connect
+        self.first_player = first_player
+
+        self.players = ['o', 'x']
+        self.player_codes = {'o': 1, 'x': 2}
+
+        # Cell indices of every line of num_connect cells in a flattened grid
+        self.windows = utils.winning_windows(num_cols, num_rows, num_connect)
+
+        # Base-3 weights of the cells, as object (Python int) array once the keys no longer fit into int64
+        num_cells = num_rows * num_cols
+        key_dtype = np.int64 if 3 ** num_cells <= np.iinfo(np.int64).max else object
+        self.key_powers = np.array([3 ** i for i in range(num_cells)], dtype=key_dtype)
+        self.mirror_key_powers = self.key_powers.reshape(num_rows, num_cols)[:, ::-1].flatten()
+
+        self.grids = np.zeros((num_envs, num_rows, num_cols), dtype=np.int8)
+        self.lowest_free_rows = np.zeros((num_envs, num_cols), dtype=int)
+        self.player_at_turn = np.zeros(num_envs, dtype=np.int8)
+
+    def reset(self, envs=None):
+        """
+        Reset the given boards (all boards by default)
+
+        :param envs: boolean mask or index array of the boards to reset
+        """
+        if envs is None:
+            envs = np.arange(self.num_envs)
+        self.grids[envs] = 0
+        self.lowest_free_rows[envs] = 0
+
+        num_reset = len(self.player_at_turn[envs])
+        if self.first_player == 'random':
+            self.player_at_turn[envs] = np.random.randint(1, 3, size=num_reset)
+        elif self.first_player in self.players:
+            self.player_at_turn[envs] = self.player_codes[self.first_player]
         else:
-            col_candidates = self.grid[max(0, action_row - self.num_connect + 1): min(self.num_rows, action_row + self.num_connect), action_col]
-            if utils.search_sequence_numpy(col_candidates, winning_sequence):
-                game_is_won = True
-            else:
-                diag_index_up = action_col - action_row
-                diag_up_candidates = np.diagonal(self.grid, diag_index_up)
-                if utils.search_sequence_numpy(diag_up_candidates, winning_sequence):
-                    game_is_won = True
-                else:
-                    diag_index_down = action_row + action_col - (self.num_rows - 1)
-                    diag_down_candidates = np.diagonal(self.grid[::-1], diag_index_down)
-                    if utils.search_sequence_numpy(diag_down_candidates, winning_sequence):
-                        game_is_won = True
-
-        if self.verbose and game_is_won:
-            print("Player '", self.player_at_turn, "' has won the game!")
-        return game_is_won
+            raise ValueError("The argument first_player has to be either 'random', 'x', or 'o'.")
+
+    @property
+    def available_actions(self):
+        """
+        Boolean (num_envs, num_cols) mask of the columns that can still take a disk on each board
+        """
+        return self.lowest_free_rows < self.num_rows
+
+    @property
+    def keys(self):
+        """
+        Connect.key of every board
+        """
+        return self.grids.reshape(self.num_envs, -1).astype(self.key_powers.dtype) @ self.key_powers
+
+    @property
+    def mirror_keys(self):
+        """
+        Connect.mirror_key of every board
+        """
+        return self.grids.reshape(self.num_envs, -1).astype(self.key_powers.dtype) @ self.mirror_key_powers
+
+    def step(self, actions):
+        """
+        Drop a disk for the player at turn on every board, then change turns and reset finished games
+
+        :param actions: integer array with one column index (known to be a valid action!) per board
+        :return: tuple (rewards, dones, wins) of arrays with one entry per board. rewards is 1 where the move
+                 won the game and 0 otherwise (from the point of view of the player that moved), dones marks
+                 games that were won or filled up and have been reset, and wins marks games that were won
+        """
+        envs = np.arange(self.num_envs)
+        rows = self.lowest_free_rows[envs, actions]
+        self.grids[envs, rows, actions] = self.player_at_turn
+        self.lowest_free_rows[envs, actions] += 1
+
+        # A board is won if any line holds num_connect disks of the player that just moved
+        lines = self.grids.reshape(self.num_envs, -1)[:, self.windows]
+        wins = np.any(np.all(lines == self.player_at_turn[:, None, None], axis=2), axis=1)
+        dones = wins | np.all(self.lowest_free_rows == self.num_rows, axis=1)
+        rewards = wins.astype(int)
 
+        self.player_at_turn = 3 - self.player_at_turn
+        if np.any(dones):
+            self.reset(dones)
+        return rewards, dones, wins
@@ -0,0 +1,142 @@
+import statistics
+from collections import namedtuple
+import numpy as np
+import connect
+import qlearning
+import utils
+
+# Result of an evaluation: mean reward per game, its confidence interval and the win/draw/loss split
+Evaluation = namedtuple('Evaluation', ['mean', 'low', 'high', 'wins', 'draws', 'losses', 'games'])
+
+
+def evaluate(agent, games=1000, seed=None, workers=None, batch_size=1024, confidence=0.95):
+    """
+    Play many greedy games of agent (as 'x') against a random first-moving 'o' and summarise the rewards
+
+    Every game is worth 1 for a win, 0 for a draw and -1 for a loss, as in qlearning.test. Agents with a
+    choose_moves method (LearningAgent, RandomAgent) play batch_size games at a time on a BatchConnect; any
+    other agent with choose_move (MinmaxAgent, StochasticMinmaxAgent) plays them one after another on a
+    copy of its environment's board. With workers, the games are split over a process pool.
+
+    :param seed: seed for the numpy RNG, so the same seed gives the same games. The global RNG state of the
+                 caller is restored afterwards. Without a seed the games continue the caller's RNG stream.
+    :param confidence: coverage of the normal-approximation interval around the mean
+    :return: an Evaluation
+    """
+    if games < 1:
+        raise ValueError("The argument games has to be a positive integer.")
+
+    if workers is not None and workers > 1:
+        chunks = [len(chunk) for chunk in np.array_split(np.arange(games), workers) if len(chunk)]
+        arguments = [(agent, chunk, chunk_seed, batch_size)
+                     for chunk, chunk_seed in zip(chunks, utils.seeds(seed, len(chunks)))]
+        counts = np.sum(utils.run_all(count_results, arguments, workers), axis=0)
+    else:
+        counts = count_results((agent, games, seed, batch_size))
+    return summarise(*counts, confidence=confidence)
+
+
+def count_results(arguments):
+    """
+    Play games and return the array [wins, draws, losses] (runs in a worker process)
+    """
+    agent, games, seed, batch_size = arguments
+    old_state = None
+    if seed is not None:
+        old_state = np.random.get_state()
+        np.random.seed(seed)
+
+    # Greedy action
+    old_epsilon = agent.epsilon
+    agent.epsilon = 0
+    try:
+        if hasattr(agent, 'choose_moves'):
+            counts = play_batched(agent, games, batch_size)
+        else:
+            counts = play_serial(agent, games)
+    finally:
+        agent.epsilon = old_epsilon
+        if old_state is not None:
+            np.random.set_state(old_state)
+    return counts
+
+
+def play_serial(agent, games):
+    """
+    Play games one at a time on a fresh board of the same type and size as the agent's environment
+    """
+    old_environment = agent.environment
+    environment = type(old_environment)(old_environment.num_cols, old_environment.num_rows,
+                                        old_environment.num_connect, verbose=False)
+    agent.environment = environment
+    opponent = qlearning.RandomAgent(environment=environment)
+    counts = np.zeros(3, dtype=int)
+
+    try:
+        for _ in range(games):
+            environment.reset(first_player='o')
+
+            # Opponent takes first turn, then both players alternate until the game is over
+            environment.act(action = opponent.choose_move())
+            while not environment.is_terminal:
+                environment.change_turn()
+                player = agent if environment.player_at_turn == 'x' else opponent
+                environment.act(action = player.choose_move())
+
+            if environment.winner == 'x':
+                counts[0] += 1
+            elif environment.winner == 'o':
+                counts[2] += 1
+            else:
+                counts[1] += 1
+    finally:
+        agent.environment = old_environment
+    return counts
+
+
+def play_batched(agent, games, batch_size):
+    """
+    Play games in rounds of up to batch_size boards, counting exactly one game per board and round
+
+    Finished boards are reset by BatchConnect and keep moving, but only the first game of every board
+    in a round is counted, so short games are not over-represented.
+    """
+    environment = agent.environment
+    opponent = qlearning.RandomAgent(environment=None)
+    counts = np.zeros(3, dtype=int)
+
+    while games > 0:
+        num_envs = min(games, batch_size)
+        batch = connect.BatchConnect(num_envs, environment.num_cols, environment.num_rows,
+                                     environment.num_connect, first_player='o')
+        batch.reset()
+        finished = np.zeros(num_envs, dtype=bool)
+
+        while not finished.all():
+            agent_turn = batch.player_at_turn == batch.player_codes['x']
+            actions = np.where(agent_turn, agent.choose_moves(batch), opponent.choose_moves(batch))
+            _, dones, wins = batch.step(actions)
+
+            # Count games that ended for the first time in this round
+            new = dones & ~finished
+            counts[0] += np.count_nonzero(new & wins & agent_turn)
+            counts[1] += np.count_nonzero(new & ~wins)
+            counts[2] += np.count_nonzero(new & wins & ~agent_turn)
+            finished |= dones
+        games -= num_envs
+    return counts
+
+
+def summarise(wins, draws, losses, confidence=0.95):
+    """
+    Turn a win/draw/loss split into an Evaluation with a normal-approximation confidence interval
+    """
+    games = wins + draws + losses
+    rewards = np.repeat([1, 0, -1], [wins, draws, losses])
+    mean = rewards.mean()
+    half_width = 0.0
+    if games > 1:
+        z = statistics.NormalDist().inv_cdf((1 + confidence) / 2)
+        half_width = z * rewards.std(ddof=1) / np.sqrt(games)
+    return Evaluation(float(mean), float(mean - half_width), float(mean + half_width),
+                      int(wins), int(draws), int(losses), int(games))
@@ -1,119 +1,90 @@
 ### Write all your code for Part 3 in or above this cell.
-from copy import deepcopy
-import qlearning
 import minimax
 
-class StochasticMinmaxAgent(Agent):
-    def __init__(self, environment):
+class StochasticMinmaxAgent(minimax.SearchAgent):
+    # Solution tables have to be solved against a random opponent
+    stochastic = True
+    
+    def __init__(self, environment, table=None, max_depth=None, time_limit=None, node_limit=None, book=None):
         '''Initializes all required variables'''
-        super(StochasticMinmaxAgent, self).__init__(environment)
-        self.policy = {}
+        super(StochasticMinmaxAgent, self).__init__(environment, table, max_depth, time_limit, node_limit, book)
         
-    def compute_policy(self, state):
-        '''Searches tree from given state by calling expectiminimax'''
-        origin = deepcopy(state)
-        # Assume opponent has just taken turn
-        if origin.player_at_turn == 'x':
-            origin.change_turn()
-            
-        value = self.expectiminimax(origin, True)
-        return value
+    def expectiminimax(self, node, player, remaining=None):
+        '''Recursive function to evaluate board with stochastic opponent, searching remaining plies'''
+        self.count_node()
         
-    def expectiminimax(self, node, player):
-        '''Recursive function to evaluate board with stochastic opponent'''
-        # Add node to policy (or return if already found)
-        key = np.copy(node.grid)
-        key = ''.join(key.flatten())
-        if key not in self.policy:
-            self.policy[key] = 0
-        else:
-            return self.policy[key]
+        # Searches reaching past the last empty cell are complete
+        empty = self.num_cells - len(node.history)
+        remaining = empty if remaining is None else min(remaining, empty)
+        
+        # Return value if already found and searched deep enough
+        key = self.policy.key(node)
+        entry = self.policy.lookup(key)
+        if entry is not None and entry.depth >= remaining:
+            return entry.value
         
         # Check if node is terminal and reward last player
-        if node.was_winning_move():
-            if player:
-                self.policy[key] = -1
-                return -1
-            else:
-                self.policy[key] = 1
-                return 1
-        elif node.grid_is_full():
+        if node.winner is not None:
+            bestValue = -1 if player else 1
+            self.policy[key] = minimax.Entry(bestValue, minimax.EXACT, -1, 1, empty)
+            return bestValue
+        elif node.is_draw:
             # Game drawn
+            self.policy[key] = minimax.Entry(0, minimax.EXACT, -1, 1, empty)
             return 0
+        elif remaining == 0:
+            # Search horizon reached
+            bestValue = self.evaluate(node)
+            self.policy[key] = minimax.Entry(bestValue, minimax.EXACT, -1, 1, 0)
+            return bestValue
         
         node.change_turn()
         # Maximizing player
         if player:
             bestValue = -1
             for a in node.available_actions:
-                # Create child node and corresponding key
-                child = deepcopy(node)
-                child.act(action = a)
-                new_key = np.copy(child.grid)
-                new_key = ''.join(new_key.flatten())
-                
-                # Check if key already found
-                if new_key not in self.policy:
-                    self.policy[new_key] = self.expectiminimax(child, False)
+                # Search child node in place
+                node.act(action = a)
+                value = self.expectiminimax(node, False, remaining - 1)
+                node.undo(action = a)
                     
-                bestValue = max(bestValue, self.policy[new_key])
+                bestValue = max(bestValue, value)
         
         # Minimizing player
         else:
             bestValue = 0
             for a in node.available_actions:
-                # Create child node and corresponding key
-                child = deepcopy(node)
-                child.act(action = a)
-                new_key = np.copy(child.grid)
-                new_key = ''.join(new_key.flatten())
-                
-                # Check if key already found
-                if new_key not in self.policy:
-                    self.policy[new_key] = self.expectiminimax(child, True)
+                # Search child node in place
+                node.act(action = a)
+                value = self.expectiminimax(node, True, remaining - 1)
+                node.undo(action = a)
                     
-                bestValue += self.policy[new_key]
+                bestValue += value
             
             # Average child nodes (due to equal weightings)
             bestValue = bestValue / len(node.available_actions)
         
-        self.policy[key] = bestValue
+        self.policy[key] = minimax.Entry(bestValue, minimax.EXACT, -1, 1, remaining)
         return bestValue
     
-    def choose_move(self):
-        '''Chooses best action for current state assuming optimal opponent'''
-        # Create key from current state
-        origin = deepcopy(self.environment)
-        key = np.copy(origin.grid)
-        key = ''.join(key.flatten())
-        
-        # Ensure turn always called from previous player
-        if origin.player_at_turn == 'x':
-            origin.change_turn()
-        
-        # Evaluate if new state
-        if key not in self.policy:
-            self.policy[key] = self.compute_policy(origin)
-        
-        # Find best action from available actions
+    def search_root(self, origin, remaining=None):
+        '''Returns best action for 'x' in origin and its value, searching remaining plies (to the end if None)'''
         action_value = -2
         best_action = -1
-        origin.change_turn()
             
         for a in origin.available_actions:
-            # Create child node and corresponding key
-            child = deepcopy(origin)
-            child.act(action = a)
-            new_key = np.copy(child.grid)
-            new_key = ''.join(new_key.flatten())
+            # Search child node in place
+            origin.act(action = a)
+            value = self.expectiminimax(origin, False, None if remaining is None else remaining - 1)
+            origin.undo(action = a)
             
-            # Check key against current best action
-            if self.policy[new_key] > action_value:
-                action_value = self.policy[new_key]
+            # Check value against current best action
+            if value > action_value:
+                action_value = value
                 best_action = a
                 
                 # Take winning move if found
                 if action_value == 1:
                     break
                 
-        return best_action
\ No newline at end of file
+        return best_action, action_value
\ No newline at end of file
@@ -1,17 +1,56 @@
+import numpy as np
+import connect
+import utils
 import qlearning
 import minimax
 import expectiminimax
 
-def plot_learning(agents=20, step_number=30000, interrupt=1000):
-    '''Plots learning graph for episodes played'''
-    agent_rewards = []
-    random_rewards = []
+def train_agent(arguments):
+    '''Trains one Q-learning agent and returns only its reward curves (runs in a worker process)'''
+    seed, step_number, interrupt = arguments
+    np.random.seed(seed)
+    q_agent = qlearning.play(max_steps=step_number, ver=False, n=interrupt)
+    return (q_agent.rewards, q_agent.opponent_rewards)
+
+def evaluate_agent(arguments):
+    '''Evaluates one search agent and returns only its reward curve (runs in a worker process)'''
+    seed, agent_class, step_number, interrupt = arguments
+    np.random.seed(seed)
     
+    # Setup agent and environment
+    test_env = connect.Connect(verbose=False)
+    agent = agent_class(test_env)
+    
+    # Play required episodes for agent
+    for _ in range(int(step_number/interrupt)):
+        test_env.reset(first_player='o')
+        qlearning.test(agent)
+    return agent.rewards
+
+def show_curves(curves, labels, title, interrupt, save_path=None, headless=False):
+    '''Saves curves to an .npz file if save_path is given and plots them unless headless'''
+    if save_path is not None:
+        np.savez(save_path, **dict(zip(labels, curves)))
+    if headless:
+        return
+    
+    # Only pay for matplotlib once a plot is requested
+    import matplotlib.pyplot as plt
+    plt.figure(1)
+    for curve in curves:
+        plt.plot(curve)
+    plt.title(title)
+    plt.xlabel("Number of steps performed (n=" + str(interrupt) + ")")
+    plt.ylabel("Average total reward after 10 episodes")
+    plt.legend(labels, loc = "best")
+
+def plot_learning(agents=20, step_number=30000, interrupt=1000, workers=None, seed=None, save_path=None, headless=False):
+    '''Plots learning graph for episodes played'''
     # Collect returns of all agents playing episodes
-    for _ in range(agents):
-        q_agent = play(max_steps=step_number, ver=False, n=interrupt)
-        agent_rewards.append(q_agent.rewards)
-        random_rewards.append(q_agent.opponent_rewards)
+    arguments = [(agent_seed, step_number, interrupt) for agent_seed in utils.seeds(seed, agents)]
+    results = utils.run_all(train_agent, arguments, workers)
+    agent_rewards = [rewards for rewards, _ in results]
+    random_rewards = [opponent_rewards for _, opponent_rewards in results]
     
     # Average agents across all observations
     agent_rewards = np.mean(agent_rewards, axis=0, dtype=np.float64)
@@ -27,33 +66,16 @@ def plot_learning(agents=20, step_number=30000, interrupt=1000):
         title = "Too few agents given"
     
     # Plot figure
-    plt.figure(1)
-    plt.plot(agent_rewards)
-    plt.plot(random_rewards)
-    plt.title(title)
-    plt.xlabel("Number of steps performed (n=" + str(interrupt) + ")")
-    plt.ylabel("Average total reward after 10 episodes")
-    plt.legend(["Q-Agent", "Random Agent"], loc = "best")
+    show_curves([agent_rewards, random_rewards], ["Q-Agent", "Random Agent"], title, interrupt, save_path, headless)
     
     return (agent_rewards, random_rewards)
 
-def compare_learning(qagent_rewards, random_rewards, agents = 50, step_number=50000, interrupt=1000):
+def compare_learning(qagent_rewards, random_rewards, agents = 50, step_number=50000, interrupt=1000, workers=None, seed=None,
+                     save_path=None, headless=False):
     '''Plots learning graph for episodes played'''
-    magent_rewards = []
-    
-    # Collect returns of all agents playing episodes
-    for _ in range(agents):   
-        # Setup Minimax agent and environment
-        test_env = connect.Connect(verbose=False)
-        m_agent = MinmaxAgent(test_env)
-        
-        # Play required episodes for Minimax agent
-        for _ in range(int(step_number/interrupt)):
-            test_env.reset(first_player='o')
-            test(m_agent)
-            
-        # Append reward for each agent
-        magent_rewards.append(m_agent.rewards)
+    # Collect returns of all Minimax agents playing episodes
+    arguments = [(agent_seed, minimax.MinmaxAgent, step_number, interrupt) for agent_seed in utils.seeds(seed, agents)]
+    magent_rewards = utils.run_all(evaluate_agent, arguments, workers)
     
     # Average agent across all observations
     magent_rewards = np.mean(magent_rewards, axis=0, dtype=np.float64)
@@ -68,34 +90,17 @@ def compare_learning(qagent_rewards, random_rewards, agents = 50, step_number=50
         title = "Too few agents given"
     
     # Plot figure for all agents
-    plt.figure(1)
-    plt.plot(qagent_rewards)
-    plt.plot(magent_rewards)
-    plt.plot(random_rewards)
-    plt.title(title)
-    plt.xlabel("Number of steps performed (n=" + str(interrupt) + ")")
-    plt.ylabel("Average total reward after 10 episodes")
-    plt.legend(["Q-Agent", "Minimax Agent", "Random Agent"], loc = "best")
+    show_curves([qagent_rewards, magent_rewards, random_rewards], ["Q-Agent", "Minimax Agent", "Random Agent"],
+                title, interrupt, save_path, headless)
     
     return magent_rewards
 
-def compare_all_agents(qagent_rewards, magent_rewards, random_rewards, agents = 50, step_number=50000, interrupt=1000):
+def compare_all_agents(qagent_rewards, magent_rewards, random_rewards, agents = 50, step_number=50000, interrupt=1000, workers=None, seed=None,
+                       save_path=None, headless=False):
     '''Plots learning graph for episodes played'''
-    smagent_rewards = []
-    
-    # Collect returns of all agents playing episodes
-    for _ in range(agents):
-        # Setup expectiminimax agent and environment
-        test_env = connect.Connect(verbose=False)
-        sm_agent = StochasticMinmaxAgent(test_env)
-        
-        # Play required episodes for agent
-        for _ in range(int(step_number/interrupt)):
-            test_env.reset(first_player='o')
-            test(sm_agent)
-            
-        # Append reward for each agent
-        smagent_rewards.append(sm_agent.rewards)
+    # Collect returns of all expectiminimax agents playing episodes
+    arguments = [(agent_seed, expectiminimax.StochasticMinmaxAgent, step_number, interrupt) for agent_seed in utils.seeds(seed, agents)]
+    smagent_rewards = utils.run_all(evaluate_agent, arguments, workers)
     
     # Average agents across all observations
     smagent_rewards = np.mean(smagent_rewards, axis=0, dtype=np.float64)
@@ -110,19 +115,12 @@ def compare_all_agents(qagent_rewards, magent_rewards, random_rewards, agents =
         title = "Too few agents given"
     
     # Plot figure
-    plt.figure(1)
-    plt.plot(qagent_rewards)
-    plt.plot(magent_rewards)
-    plt.plot(smagent_rewards)
-    plt.plot(random_rewards)
-    plt.title(title)
-    plt.xlabel("Number of steps performed (n=" + str(interrupt) + ")")
-    plt.ylabel("Average total reward after 10 episodes")
-    plt.legend(["Q-Agent", "Minimax Agent", "Expectiminimax Agent", "Random Agent"], loc = "best")
+    show_curves([qagent_rewards, magent_rewards, smagent_rewards, random_rewards],
+                ["Q-Agent", "Minimax Agent", "Expectiminimax Agent", "Random Agent"], title, interrupt, save_path, headless)
     
     return smagent_rewards
 	
-#agent_rewards, random_rewards = plot_learning(agents=50, step_number=50000, interrupt=1000)
+#agent_rewards, random_rewards = plot_learning(agents=50, step_number=50000, interrupt=1000, workers=4)
 #solo_agent, solo_random = plot_learning(agents=1, step_number=35000, interrupt=1000)
 #minimax_rewards = compare_learning(agent_rewards, random_rewards, agents=50, step_number=50000, interrupt=1000)
 #solo_minimax = compare_learning(solo_agent, solo_random, agents=1, step_number=35000, interrupt=1000)
@@ -0,0 +1,203 @@
+import math
+import multiprocessing
+import time
+import numpy as np
+import connect
+import qlearning
+import utils
+
+OTHER_PLAYER = {'o': 'x', 'x': 'o'}
+
+class Node:
+    __slots__ = ('player', 'children', 'untried', 'visits', 'value')
+
+    def __init__(self, player, actions):
+        '''Search tree node reached by a move of player, with its actions that have no child yet'''
+        self.player = player
+        self.children = {}
+        self.untried = list(actions)
+        self.visits = 0
+        # Sum of playout rewards from the point of view of player
+        self.value = 0.0
+
+    def select_child(self, exploration):
+        '''Returns action and child with the highest upper confidence bound (UCT)'''
+        log_visits = math.log(self.visits)
+        best_action, best_child, best_bound = None, None, -math.inf
+        for action, child in self.children.items():
+            bound = child.value / child.visits + exploration * math.sqrt(log_visits / child.visits)
+            if bound > best_bound:
+                best_action, best_child, best_bound = action, child, bound
+        return best_action, best_child
+
+def board_moves(environment):
+    '''Returns (player, action) of every move played on a Connect or BitConnect board, oldest first'''
+    actions = [last_action for last_action, _, _ in environment.history[1:]] + [environment.last_action]
+    return [(player, int(action)) for (_, player, _), action in zip(environment.history, actions)]
+
+def replay_moves(moves, num_cols, num_rows, num_connect):
+    '''Returns a BitConnect on which moves have been played'''
+    board = connect.BitConnect(num_cols, num_rows, num_connect, verbose=False)
+    board.reset(first_player='o')
+    for player, action in moves:
+        board.player_at_turn = player
+        board.act(action = action)
+    return board
+
+def rollout(board):
+    '''Plays uniformly random moves until the game ends, takes them back and returns the winner (None if drawn)'''
+    if board.is_terminal:
+        return board.winner
+
+    # One random number per remaining move
+    draws = np.random.uniform(0, 1, size=board.num_rows * board.num_cols - board.num_moves)
+    player = board.player_at_turn
+    actions = []
+    while not board.is_terminal:
+        player = OTHER_PLAYER[player]
+        board.player_at_turn = player
+        available_actions = board.available_actions
+        action = available_actions[int(draws[len(actions)] * len(available_actions))]
+        board.act(action = action)
+        actions.append(action)
+
+    winner = board.winner
+    for action in reversed(actions):
+        board.undo(action = action)
+    return winner
+
+def search(board, root, playouts, exploration, deadline=None):
+    '''Grows tree below root (the position on board) by up to playouts playouts, stopping early at deadline'''
+    for playout in range(playouts):
+        if deadline is not None and playout % 16 == 0 and time.perf_counter() > deadline:
+            break
+        node = root
+        path = [root]
+        actions = []
+
+        # Selection: follow highest bounds through fully expanded nodes
+        while not node.untried and node.children:
+            action, node = node.select_child(exploration)
+            board.player_at_turn = node.player
+            board.act(action = action)
+            path.append(node)
+            actions.append(action)
+
+        # Expansion: add one random untried action
+        if node.untried:
+            action = node.untried.pop(np.random.randint(len(node.untried)))
+            player = OTHER_PLAYER[node.player]
+            board.player_at_turn = player
+            board.act(action = action)
+            child = Node(player, [] if board.is_terminal else board.available_actions)
+            node.children[action] = child
+            path.append(child)
+            actions.append(action)
+
+        # Simulation and backpropagation
+        winner = rollout(board)
+        for node in path:
+            node.visits += 1
+            if winner is not None:
+                node.value += 1 if node.player == winner else -1
+        for action in reversed(actions):
+            board.undo(action = action)
+
+def root_statistics(arguments):
+    '''Searches a fresh tree and returns {action: (visits, value)} of its root (runs in a worker process)'''
+    moves, dimensions, playouts, exploration, time_limit, seed = arguments
+    np.random.seed(seed)
+    board = replay_moves(moves, *dimensions)
+    root = Node('o', board.available_actions)
+    deadline = None if time_limit is None else time.perf_counter() + time_limit
+    search(board, root, playouts, exploration, deadline)
+    return {action: (child.visits, child.value) for action, child in root.children.items()}
+
+class MCTSAgent(qlearning.Agent):
+    def __init__(self, environment, playouts=1000, exploration=1.4, time_limit=None, reuse_tree=True, workers=None):
+        '''Monte Carlo tree search (UCT) agent playing 'x' with a budget of playouts (and seconds) per move'''
+        super(MCTSAgent, self).__init__(environment)
+        self.playouts = playouts
+        self.exploration = exploration
+        self.time_limit = time_limit
+        self.reuse_tree = reuse_tree
+        # Root-parallel search: workers search independent trees and their root statistics are summed
+        self.workers = workers
+        self.pool = None
+        # Tree of the last search, continued if the game went on from it
+        self.root = None
+        self.root_moves = None
+
+    def __getstate__(self):
+        '''Leaves pool and search tree behind when sent to another process'''
+        state = self.__dict__.copy()
+        state.update(pool=None, root=None, root_moves=None)
+        return state
+
+    def choose_move(self):
+        '''Chooses the most visited action at the root after searching the current state'''
+        moves = board_moves(self.environment)
+        dimensions = (self.environment.num_cols, self.environment.num_rows, self.environment.num_connect)
+
+        if self.workers is not None and self.workers > 1:
+            return self.parallel_move(moves, dimensions)
+
+        board = replay_moves(moves, *dimensions)
+        root = self.reused_root(moves)
+        if root is None:
+            # The opponent has just moved
+            root = Node('o', board.available_actions)
+        deadline = None if self.time_limit is None else time.perf_counter() + self.time_limit
+        search(board, root, self.playouts, self.exploration, deadline)
+
+        # Play a random move if the budget ran out before the first playout
+        if not root.children:
+            return self.random_move()
+        best_action = max(root.children, key=lambda action: root.children[action].visits)
+        # Keep subtree of chosen action for the next move
+        if self.reuse_tree:
+            self.root = root.children[best_action]
+            self.root_moves = moves + [('x', best_action)]
+        return best_action
+
+    def reused_root(self, moves):
+        '''Returns node of the previous tree for the position after moves (None if it is not in that tree)'''
+        if not self.reuse_tree or self.root is None or moves[:len(self.root_moves)] != self.root_moves:
+            return None
+        node = self.root
+        for player, action in moves[len(self.root_moves):]:
+            node = node.children.get(action)
+            if node is None or node.player != player:
+                return None
+        return node
+
+    def parallel_move(self, moves, dimensions):
+        '''Splits the playouts over worker processes that each search their own tree and returns the most visited action'''
+        if self.pool is None:
+            self.pool = multiprocessing.Pool(self.workers)
+        playouts = [len(chunk) for chunk in np.array_split(np.arange(self.playouts), self.workers)]
+        arguments = [(moves, dimensions, worker_playouts, self.exploration, self.time_limit, seed)
+                     for worker_playouts, seed in zip(playouts, utils.seeds(np.random.randint(2 ** 31), self.workers))]
+
+        # Sum visits of every root action over all trees
+        visits = {}
+        for statistics in self.pool.map(root_statistics, arguments):
+            for action, (action_visits, _) in statistics.items():
+                visits[action] = visits.get(action, 0) + action_visits
+        if not visits:
+            return self.random_move()
+        return max(visits, key=visits.get)
+
+    def close(self):
+        '''Shuts down the worker processes of root-parallel search (they live until this is called)'''
+        if self.pool is not None:
+            self.pool.close()
+            self.pool.join()
+            self.pool = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        '''Closes the worker pool at the end of a with block'''
+        self.close()
@@ -1,124 +1,334 @@
+from collections import namedtuple
 from copy import deepcopy
+import time
+import numpy as np
+import utils
 import qlearning
 
-class MinmaxAgent(Agent):
-    def __init__(self, environment):
-        '''Initialized all required variables'''
-        super(MinmaxAgent, self).__init__(environment)
-        self.policy = {}
+# Bound types of transposition entries: the stored value is exact, a lower bound or an upper bound
+EXACT, LOWER, UPPER = 0, 1, 2
+
+# Value of a searched state with its bound type, the alpha-beta window it was searched with, the number of plies
+# searched below it (a depth equal to the number of empty cells means the value is not a heuristic estimate) and
+# the best action found, in the orientation of the canonical key (None if no action was searched)
+Entry = namedtuple('Entry', ['value', 'flag', 'alpha', 'beta', 'depth', 'best_action'], defaults=[None])
+
+class SearchTimeout(Exception):
+    '''Raised inside a search once the time or node budget of the current move is used up'''
+    pass
+
+def evaluate(node, windows):
+    '''Heuristic value in (-1, 1) of a non-terminal node for 'x', counting lines still open to each player'''
+    cells = node.grid.ravel()[windows]
+    x_disks = np.sum(cells == 'x', axis=1)
+    o_disks = np.sum(cells == 'o', axis=1)
+    
+    # A line is open to a player while the other player has no disk in it; weigh it by the square of disks in it
+    score = np.sum(x_disks[o_disks == 0] ** 2) - np.sum(o_disks[x_disks == 0] ** 2)
+    
+    # No line is complete in a non-terminal node, so this stays strictly between a loss and a win
+    return score / (len(windows) * windows.shape[1] ** 2)
+
+class TranspositionTable(dict):
+    def __init__(self):
+        '''Table of search values keyed by canonical key, counting hits and misses of lookups'''
+        super(TranspositionTable, self).__init__()
+        self.hits = 0
+        self.misses = 0
+    
+    def key(self, node):
+        '''Returns canonical key of node (the smaller of its key and mirrored key, as both states have equal value)'''
+        return min(node.key, node.mirror_key)
+    
+    def lookup(self, key):
+        '''Returns stored value of key (None if not found), counting the hit or miss'''
+        value = self.get(key)
+        if value is None:
+            self.misses += 1
+        else:
+            self.hits += 1
+        return value
+
+class SearchAgent(qlearning.Agent):
+    # Whether the agent plays against a random rather than an optimal opponent (solution tables must match)
+    stochastic = False
+    
+    def __init__(self, environment, table=None, max_depth=None, time_limit=None, node_limit=None, book=None):
+        '''Initializes variables shared by the search agents'''
+        super(SearchAgent, self).__init__(environment)
+        # Entries of searched states, one per pair of mirror-image states
+        self.policy = TranspositionTable()
+        # Optional read-only solver.SolutionTable answering every move without search
+        if table is not None:
+            table.check(environment, stochastic=self.stochastic)
+        self.table = table
+        # Optional opening_book.OpeningBook answering the first moves with a single lookup
+        if book is not None:
+            book.check(environment, stochastic=self.stochastic)
+        self.book = book
+        
+        # Iterative deepening is used once any limit is given (max_depth in plies, time_limit in seconds per move)
+        self.max_depth = max_depth
+        self.time_limit = time_limit
+        self.node_limit = node_limit
+        self.num_cells = environment.num_rows * environment.num_cols
+        self.windows = utils.winning_windows(environment.num_cols, environment.num_rows, environment.num_connect)
+        
+        # Number of nodes searched, and budget of the current move
+        self.nodes = 0
+        self.node_budget = None
+        self.deadline = None
+    
+    def count_node(self):
+        '''Counts a searched node, raising SearchTimeout once the budget of the current move is used up'''
+        self.nodes += 1
+        if self.node_budget is not None and self.nodes > self.node_budget:
+            raise SearchTimeout()
+        # Only look at the clock every 256 nodes
+        if self.deadline is not None and self.nodes % 256 == 0 and time.perf_counter() > self.deadline:
+            raise SearchTimeout()
+    
+    def evaluate(self, node):
+        '''Returns heuristic value of node at the search horizon'''
+        return evaluate(node, self.windows)
+    
+    def choose_move(self):
+        '''Chooses best action for current state'''
+        # Play book move while in the opening
+        if self.book is not None:
+            action = self.book.lookup(self.environment.key)
+            if action is not None:
+                return action
         
-    def compute_policy(self, state):
-        '''Searches tree from given state by calling minimax'''
-        origin = deepcopy(state)
-        # Assume opponent has just taken turn
+        # Read values of child states straight from solved table if given, searching positions it does not hold
+        # (the solver only covers games in which 'o' moved first)
+        if self.table is not None:
+            try:
+                return self.table.best_action(self.environment, 'x')
+            except KeyError:
+                pass
+        
+        origin = deepcopy(self.environment)
+        
+        # Ensure turn always called from previous player, then let 'x' move
         if origin.player_at_turn == 'x':
             origin.change_turn()
-            
-        value = self.minimax(origin, -1, +1, True)
-        return value
+        origin.change_turn()
         
-    def minimax(self, node, alpha, beta, player):
-        '''Recursive function to evaluate board with alpha-beta pruning'''
-        # Add node to policy (or return if already found)
-        key = np.copy(node.grid)
-        key = ''.join(key.flatten())
-        if key not in self.policy:
-            self.policy[key] = 0
-        else:
-            return self.policy[key]
+        # Search to terminal states unless limited
+        if self.max_depth is None and self.time_limit is None and self.node_limit is None:
+            best_action, _ = self.search_root(origin)
+            return best_action
+        return self.iterative_deepening(origin)
+    
+    def iterative_deepening(self, origin):
+        '''Searches one ply deeper at a time until budget runs out, returning best action of deepest completed search'''
+        empty = self.num_cells - len(origin.history)
+        max_depth = empty if self.max_depth is None else min(self.max_depth, empty)
+        if self.node_limit is not None:
+            self.node_budget = self.nodes + self.node_limit
+        if self.time_limit is not None:
+            self.deadline = time.perf_counter() + self.time_limit
         
-        # Check if node is terminal and reward last player
-        if node.was_winning_move():
-            if player:
-                self.policy[key] = -1
-                return -1
+        # Fall back on first available action if not even one ply can be searched
+        best_action = origin.available_actions[0]
+        try:
+            for depth in range(1, max_depth + 1):
+                best_action, value = self.search_root(origin, depth)
+                # Stop once the game is decided (best actions stored by shallower searches are searched first by the
+                # next one)
+                if abs(value) == 1:
+                    break
+        except SearchTimeout:
+            pass
+        finally:
+            self.node_budget = None
+            self.deadline = None
+        return best_action
+    
+    def search_root(self, origin, remaining=None):
+        '''Returns best action for 'x' in origin and its value, searching remaining plies (to the end if None)'''
+        raise NotImplementedError
+
+class ColumnOrdering():
+    def __init__(self, environment):
+        '''Move ordering that searches columns from left to right'''
+        self.num_cols = environment.num_cols
+    
+    def order(self, node, actions, depth):
+        '''Returns actions of node in the order they should be searched'''
+        return actions
+    
+    def record_cutoff(self, node, action, depth):
+        '''Called when action caused a beta cutoff at given depth (node has action undone)'''
+        pass
+
+class CenterOrdering(ColumnOrdering):
+    def __init__(self, environment):
+        '''Move ordering that searches columns from the center outwards'''
+        super(CenterOrdering, self).__init__(environment)
+        center = (self.num_cols-1) / 2
+        self.rank = [abs(col - center) for col in range(self.num_cols)]
+    
+    def order(self, node, actions, depth):
+        '''Returns actions sorted center-first (left before right on ties)'''
+        return sorted(actions, key=lambda a: self.rank[a])
+
+class KillerHistoryOrdering(CenterOrdering):
+    def __init__(self, environment):
+        '''Move ordering by a history table of cutoffs, falling back on a killer move per depth and center-first'''
+        super(KillerHistoryOrdering, self).__init__(environment)
+        # Last action to cause a cutoff at each search depth
+        self.killers = {}
+        # Number of cutoffs caused by each player dropping a disk into each cell, kept across searches
+        self.history = {player: np.zeros((environment.num_rows, environment.num_cols), dtype=int)
+                        for player in environment.players}
+    
+    def order(self, node, actions, depth):
+        '''Returns actions by history score, ties broken by killer move first and then center-first'''
+        killer = self.killers.get(depth)
+        history = self.history[node.player_at_turn]
+        rows = node.lowest_free_rows
+        return sorted(actions, key=lambda a: (-history[rows[a], a], a != killer, self.rank[a]))
+    
+    def record_cutoff(self, node, action, depth):
+        '''Stores action as killer move of depth and adds to its history score'''
+        self.killers[depth] = action
+        self.history[node.player_at_turn][node.lowest_free_rows[action], action] += 1
+
+class MinmaxAgent(SearchAgent):
+    def __init__(self, environment, table=None, ordering=None, max_depth=None, time_limit=None, node_limit=None,
+                 book=None):
+        '''Initialized all required variables'''
+        super(MinmaxAgent, self).__init__(environment, table, max_depth, time_limit, node_limit, book)
+        # Move ordering of the alpha-beta search (shared across choose_move calls); the default fixed left-to-right
+        # order keeps the choice among equally valued moves independent of earlier searches
+        if ordering is None:
+            ordering = ColumnOrdering(environment)
+        self.ordering = ordering
+        
+    def minimax(self, node, alpha, beta, player, depth=0, remaining=None):
+        '''Recursive function to evaluate board with alpha-beta pruning, searching remaining plies'''
+        self.count_node()
+        
+        # Searches reaching past the last empty cell are complete
+        empty = self.num_cells - len(node.history)
+        remaining = empty if remaining is None else min(remaining, empty)
+        
+        # Use stored entry if found, searched deep enough and its bound allows a cutoff in this window
+        key = self.policy.key(node)
+        entry = self.policy.lookup(key)
+        if entry is not None and entry.depth >= remaining:
+            if entry.flag == EXACT:
+                return entry.value
+            elif entry.flag == LOWER:
+                alpha = max(alpha, entry.value)
             else:
-                self.policy[key] = 1
-                return 1
-        elif node.grid_is_full():
+                beta = min(beta, entry.value)
+            if beta <= alpha:
+                return entry.value
+        
+        # Check if node is terminal and reward last player
+        if node.winner is not None:
+            bestValue = -1 if player else 1
+            self.policy[key] = Entry(bestValue, EXACT, alpha, beta, empty)
+            return bestValue
+        elif node.is_draw:
             # Game drawn
+            self.policy[key] = Entry(0, EXACT, alpha, beta, empty)
             return 0
+        elif remaining == 0:
+            # Search horizon reached
+            bestValue = self.evaluate(node)
+            self.policy[key] = Entry(bestValue, EXACT, alpha, beta, 0)
+            return bestValue
         
+        window = (alpha, beta)
         node.change_turn()
+        actions = self.ordered_actions(node, depth, entry)
+        bestAction = actions[0]
         # Maximizing player
         if player:
             bestValue = -1
-            for a in node.available_actions:
-                # Create child node and corresponding key
-                child = deepcopy(node)
-                child.act(action = a)
-                new_key = np.copy(child.grid)
-                new_key = ''.join(new_key.flatten())
-                
-                # Check if key already found
-                if new_key not in self.policy:
-                    self.policy[new_key] = self.minimax(child, alpha, beta, False)
+            for a in actions:
+                # Search child node in place
+                node.act(action = a)
+                value = self.minimax(node, alpha, beta, False, depth + 1, remaining - 1)
+                node.undo(action = a)
                     
-                bestValue = max(bestValue, self.policy[new_key])
+                if value > bestValue:
+                    bestValue = value
+                    bestAction = a
                 
                 # Prune unnecessary nodes
                 alpha = max(alpha, bestValue)
                 if beta <= alpha:
+                    self.ordering.record_cutoff(node, a, depth)
                     break
         
         # Minimizing player
         else:
             bestValue = 1
-            for a in node.available_actions:
-                # Create child node and corresponding key
-                child = deepcopy(node)
-                child.act(action = a)
-                new_key = np.copy(child.grid)
-                new_key = ''.join(new_key.flatten())
-                
-                # Check if key already found
-                if new_key not in self.policy:
-                    self.policy[new_key] = self.minimax(child, alpha, beta, True)
+            for a in actions:
+                # Search child node in place
+                node.act(action = a)
+                value = self.minimax(node, alpha, beta, True, depth + 1, remaining - 1)
+                node.undo(action = a)
                     
-                bestValue = min(bestValue, self.policy[new_key])
+                if value < bestValue:
+                    bestValue = value
+                    bestAction = a
                 
                 # Prune unnecessary nodes
                 beta = min(beta, bestValue)
                 if beta <= alpha:
+                    self.ordering.record_cutoff(node, a, depth)
                     break
         
-        self.policy[key] = bestValue
+        # Values outside the searched window are only bounds on the true value
+        if bestValue <= window[0]:
+            flag = UPPER
+        elif bestValue >= window[1]:
+            flag = LOWER
+        else:
+            flag = EXACT
+        bestAction = self.canonical_action(node, bestAction)
+        self.policy[key] = Entry(bestValue, flag, window[0], window[1], remaining, bestAction)
         return bestValue
     
-    def choose_move(self):
-        '''Chooses best action for current state assuming optimal opponent'''
-        # Create key from current state
-        origin = deepcopy(self.environment)
-        key = np.copy(origin.grid)
-        key = ''.join(key.flatten())
-        
-        # Ensure turn always called from previous player
-        if origin.player_at_turn == 'x':
-            origin.change_turn()
-        
-        # Evaluate if new state
-        if key not in self.policy:
-            self.policy[key] = self.compute_policy(origin)
-        
-        # Find best action from available actions
+    def canonical_action(self, node, action):
+        '''Returns action of node in the orientation of its canonical key (and back, as mirroring is its own inverse)'''
+        return action if node.key <= node.mirror_key else node.num_cols-1 - action
+    
+    def ordered_actions(self, node, depth, entry):
+        '''Returns actions of node in search order, starting with the best action of its entry from an earlier search'''
+        actions = list(self.ordering.order(node, node.available_actions, depth))
+        if entry is not None and entry.best_action is not None:
+            action = self.canonical_action(node, entry.best_action)
+            actions.remove(action)
+            actions.insert(0, action)
+        return actions
+    
+    def search_root(self, origin, remaining=None):
+        '''Returns best action for 'x' in origin and its value, searching remaining plies (to the end if None)'''
         action_value = -2
         best_action = -1
-        origin.change_turn()
-            
-        for a in origin.available_actions:
-            # Create child node and corresponding key
-            child = deepcopy(origin)
-            child.act(action = a)
-            new_key = np.copy(child.grid)
-            new_key = ''.join(new_key.flatten())
+        alpha = -1
+        
+        for a in self.ordering.order(origin, origin.available_actions, 0):
+            # Search child node in place; children no better than alpha only return an upper bound
+            origin.act(action = a)
+            value = self.minimax(origin, alpha, +1, False, 1, None if remaining is None else remaining - 1)
+            origin.undo(action = a)
             
-            # Check key against current best action
-            if self.policy[new_key] > action_value:
-                action_value = self.policy[new_key]
+            # Check value against current best action
+            if value > action_value:
+                action_value = value
                 best_action = a
                 
                 # Take winning move if found
                 if action_value == 1:
                     break
+            alpha = max(alpha, value)
                 
-        return best_action
\ No newline at end of file
+        return best_action, action_value
\ No newline at end of file
@@ -0,0 +1,135 @@
+import argparse
+import numpy as np
+import connect
+import solver
+import utils
+
+
+class OpeningBook:
+    def __init__(self, keys, actions, num_cols, num_rows, num_connect, stochastic):
+        """
+        Best first moves of 'x' for every position of the opening, answered with a single dict lookup
+
+        Positions are stored under their own Connect.key, not a key shared with the mirrored board: ties between
+        equally good columns go to the lowest column of each board (as in the search agents and
+        SolutionTable.best_action), which mirroring a stored move would turn into the highest.
+
+        :param keys: keys of the positions (any integer sequence, keys may exceed 64 bits)
+        :param actions: best column of 'x' in each position
+        """
+        self.moves = dict(zip((int(key) for key in keys), (int(action) for action in actions)))
+        self.num_cols = num_cols
+        self.num_rows = num_rows
+        self.num_connect = num_connect
+        self.stochastic = stochastic
+
+    def __len__(self):
+        return len(self.moves)
+
+    def lookup(self, key):
+        """
+        Return the best column of 'x' in the position with the given key, or None if not in the book
+        """
+        return self.moves.get(key)
+
+    def check(self, board, stochastic):
+        """
+        Raise a ValueError if the book was not built for the dimensions of board and the given kind of opponent
+        """
+        if (self.num_cols, self.num_rows, self.num_connect) != (board.num_cols, board.num_rows, board.num_connect):
+            raise ValueError("The opening book was built for a %dx%d board with %d to connect." %
+                             (self.num_cols, self.num_rows, self.num_connect))
+        if self.stochastic != stochastic:
+            raise ValueError("The opening book was built for a%s opponent." %
+                             (" random" if self.stochastic else "n optimal"))
+
+    def save(self, path):
+        """
+        Write the book to a .npz file
+        """
+        keys = list(self.moves)
+        np.savez(path, keys=utils.key_array(keys), actions=np.array([self.moves[key] for key in keys], dtype=np.int8),
+                 dimensions=np.array([self.num_cols, self.num_rows, self.num_connect, int(self.stochastic)]))
+
+    @classmethod
+    def load(cls, path):
+        """
+        Read a book written by save()
+        """
+        with np.load(path) as arrays:
+            num_cols, num_rows, num_connect, stochastic = (int(value) for value in arrays['dimensions'])
+            return cls(utils.key_list(arrays['keys']), arrays['actions'], num_cols, num_rows, num_connect,
+                       bool(stochastic))
+
+
+def build_book(plies, num_cols=5, num_rows=3, num_connect=3, stochastic=False, table=None, agent=None):
+    """
+    Find the best move of 'x' in every position with fewer than plies disks that can arise with 'o' moving first
+
+    Moves are read from a solver.SolutionTable if table is given, or chosen by agent (e.g. a MinmaxAgent with a
+    max_depth for boards too big to solve). Without either, the game is solved first.
+
+    :return: an OpeningBook
+    """
+    if agent is None and table is None:
+        table = solver.solve(num_cols, num_rows, num_connect, stochastic)
+    if table is not None:
+        table.check(connect.BitConnect(num_cols, num_rows, num_connect, verbose=False), stochastic)
+
+    board = connect.BitConnect(num_cols, num_rows, num_connect, verbose=False)
+    board.reset(first_player='o')
+    moves = {}
+    # The agent is pointed at the book's board while building, so save its own board to restore afterwards
+    old_environment = None if agent is None else agent.environment
+    try:
+        add_positions(board, plies, moves, table, agent)
+    finally:
+        if agent is not None:
+            agent.environment = old_environment
+    return OpeningBook(list(moves), list(moves.values()), num_cols, num_rows, num_connect, stochastic)
+
+
+def add_positions(board, plies, moves, table, agent):
+    """
+    Recursively fill moves (key -> best action) for the positions after every move of 'o' on board
+    """
+    for response in board.available_actions:
+        board.player_at_turn = 'o'
+        board.act(response)
+        if not board.is_terminal and board.num_moves < plies:
+            # Position with 'x' at turn
+            board.player_at_turn = 'x'
+            key = board.key
+            if key not in moves:
+                if table is not None:
+                    action = table.best_action(board, 'x')
+                else:
+                    agent.environment = board
+                    action = agent.choose_move()
+                    board.player_at_turn = 'x'
+                moves[key] = action
+
+                for a in board.available_actions:
+                    board.player_at_turn = 'x'
+                    board.act(a)
+                    if not board.is_terminal and board.num_moves < plies:
+                        add_positions(board, plies, moves, table, agent)
+                    board.undo(a)
+        board.undo(response)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Build an opening book of the best first moves of 'x'.")
+    parser.add_argument('path')
+    parser.add_argument('--plies', type=int, default=6, help="cover positions with fewer than this many disks")
+    parser.add_argument('--num-cols', type=int, default=5)
+    parser.add_argument('--num-rows', type=int, default=3)
+    parser.add_argument('--num-connect', type=int, default=3)
+    parser.add_argument('--stochastic', action='store_true', help="best moves against a uniformly random opponent")
+    parser.add_argument('--table', help="read moves from this solution table instead of solving the game")
+    args = parser.parse_args()
+
+    table = None if args.table is None else solver.SolutionTable.load(args.table)
+    book = build_book(args.plies, args.num_cols, args.num_rows, args.num_connect, args.stochastic, table)
+    book.save(args.path)
+    print("Stored", len(book), "positions.")
@@ -0,0 +1,170 @@
+import functools
+import json
+import time
+from collections import Counter
+from contextlib import contextmanager
+import connect
+import minimax
+import qlearning
+
+# Profile collecting the counts while instrumentation is enabled, and the (owner, name, original) of every patch
+_active = None
+_patches = []
+
+
+class Profile:
+    def __init__(self):
+        """
+        Counters and timing spans collected while instrumentation is enabled
+
+        counters holds call counts (act calls, win checks, deepcopies), spans the number of calls and total
+        seconds of every timed method, and searches one (nodes, table hits, table misses) tuple per
+        SearchAgent.choose_move call.
+        """
+        self.counters = Counter()
+        self.spans = {}
+        self.searches = []
+
+    def add_span(self, name, seconds):
+        span = self.spans.setdefault(name, [0, 0.0])
+        span[0] += 1
+        span[1] += seconds
+
+    def summary(self):
+        """
+        Return a JSON-serialisable dict with the counters, spans and search statistics of the run
+        """
+        summary = {'counters': dict(self.counters),
+                   'spans': {name: {'calls': calls, 'seconds': seconds, 'mean_us': 1e6 * seconds / calls}
+                             for name, (calls, seconds) in self.spans.items()}}
+        if self.searches:
+            nodes, hits, misses = (list(column) for column in zip(*self.searches))
+            lookups = sum(hits) + sum(misses)
+            summary['searches'] = {'calls': len(self.searches), 'nodes': sum(nodes), 'max_nodes': max(nodes),
+                                   'mean_nodes': sum(nodes) / len(nodes), 'table_hits': sum(hits),
+                                   'table_misses': sum(misses),
+                                   'table_hit_rate': sum(hits) / lookups if lookups else 0.0}
+        return summary
+
+    def dump(self, path=None):
+        """
+        Write the summary as JSON to path, or print it in readable form if path is None
+        """
+        summary = self.summary()
+        if path is not None:
+            with open(path, 'w') as f:
+                json.dump(summary, f, indent=2)
+            return
+        for name, count in sorted(summary['counters'].items()):
+            print("%-32s %12d" % (name, count))
+        for name, span in sorted(summary['spans'].items()):
+            print("%-32s %12d calls %10.3fs %10.1fus/call" % (name, span['calls'], span['seconds'], span['mean_us']))
+        if 'searches' in summary:
+            print("%(calls)d searches: %(nodes)d nodes (mean %(mean_nodes).1f, max %(max_nodes)d), "
+                  "table hit rate %(table_hit_rate).3f" % summary['searches'])
+
+
+def counted(name, function):
+    """
+    Wrap function to count its calls under name
+    """
+    @functools.wraps(function)
+    def wrapper(*args, **kwargs):
+        _active.counters[name] += 1
+        return function(*args, **kwargs)
+    return wrapper
+
+
+def timed(name, function):
+    """
+    Wrap function to count its calls and add up their wall time under name
+    """
+    @functools.wraps(function)
+    def wrapper(*args, **kwargs):
+        start = time.perf_counter()
+        try:
+            return function(*args, **kwargs)
+        finally:
+            _active.add_span(name, time.perf_counter() - start)
+    return wrapper
+
+
+def searched(function, timing):
+    """
+    Wrap SearchAgent.choose_move to record the nodes expanded and table hits and misses of every call
+    """
+    if timing:
+        function = timed('SearchAgent.choose_move', function)
+
+    @functools.wraps(function)
+    def wrapper(self, *args, **kwargs):
+        nodes, hits, misses = self.nodes, self.policy.hits, self.policy.misses
+        try:
+            return function(self, *args, **kwargs)
+        finally:
+            _active.searches.append((self.nodes - nodes, self.policy.hits - hits, self.policy.misses - misses))
+    return wrapper
+
+
+def patch(owner, name, wrap):
+    original = getattr(owner, name)
+    _patches.append((owner, name, original))
+    setattr(owner, name, wrap(original))
+
+
+def enable(timing=False):
+    """
+    Start collecting counters (and timing spans around choose_move and learn if timing) into a new Profile
+
+    The methods are wrapped in place, so nothing is counted, and nothing costs extra, until this is called.
+
+    :return: the Profile being filled
+    """
+    global _active
+    if _active is not None:
+        raise ValueError("Profiling is already enabled.")
+    _active = Profile()
+
+    for board_class in [connect.Connect, connect.BitConnect]:
+        name = board_class.__name__
+        patch(board_class, 'act', functools.partial(counted, name + '.act'))
+        patch(board_class, 'check_last_move', functools.partial(counted, name + '.check_last_move'))
+        patch(board_class, 'was_winning_move', functools.partial(counted, name + '.was_winning_move'))
+    patch(minimax, 'deepcopy', functools.partial(counted, 'deepcopy'))
+    patch(minimax.SearchAgent, 'choose_move', lambda function: searched(function, timing))
+    if timing:
+        for agent_class in [qlearning.LearningAgent, qlearning.RandomAgent]:
+            name = agent_class.__name__
+            patch(agent_class, 'choose_move', functools.partial(timed, name + '.choose_move'))
+        patch(qlearning.LearningAgent, 'learn', functools.partial(timed, 'LearningAgent.learn'))
+    return _active
+
+
+def disable():
+    """
+    Remove all instrumentation
+
+    :return: the Profile that was being filled (None if profiling was not enabled)
+    """
+    global _active
+    while _patches:
+        owner, name, original = _patches.pop()
+        setattr(owner, name, original)
+    profile, _active = _active, None
+    return profile
+
+
+@contextmanager
+def profiled(timing=False):
+    """
+    Collect counters within a with block, e.g.
+
+        with profiling.profiled(timing=True) as profile:
+            qlearning.play(max_steps=10000)
+        profile.dump()
+    """
+    profile = enable(timing)
+    try:
+        yield profile
+    finally:
+        disable()
@@ -1,7 +1,8 @@
+import os
 import connect
+import checkpoint
+import utils
 import numpy as np
-import matplotlib.pyplot as plt
-%matplotlib inline
 
 class Agent():
     def __init__(self, environment, alpha=0.1, epsilon=0.2):
@@ -17,96 +18,414 @@ class Agent():
         chosen_action = np.random.choice(available_actions)
         return chosen_action
     
+    def candidate_moves(self):
+        '''Returns the moves the greedy policy chooses from uniformly at random (just one if deterministic)'''
+        return [self.choose_move()]
+    
+    def random_moves(self, batch_environment):
+        '''Returns a random available move for every board of a BatchConnect'''
+        # Random scores, with unavailable actions never scoring highest
+        scores = np.random.uniform(0, 1, size=batch_environment.available_actions.shape)
+        scores[~batch_environment.available_actions] = -1
+        return scores.argmax(axis=1)
+    
+class DictQTable(dict):
+    def __init__(self, num_cols):
+        '''Q-table with one entry per state-action key (state * num_cols + action), mirrored entries stored separately'''
+        super(DictQTable, self).__init__()
+        self.num_cols = num_cols
+    
+    def action_values(self, state, symm_state, actions):
+        '''Returns Q-values of actions in state, adding unseen state-actions for state and symmetrical state'''
+        board_max_index = self.num_cols-1
+        state, symm_state = state * self.num_cols, symm_state * self.num_cols
+        values = np.empty(len(actions))
+        for i, action in enumerate(actions):
+            key = state + int(action)
+            symm_key = symm_state + board_max_index-int(action)
+            if key not in self:
+                self[key] = 0
+            if symm_key not in self:
+                self[symm_key] = 0
+            values[i] = self[key]
+        return values
+    
+    def batch_values(self, states, symm_states):
+        '''Returns (len(states), num_cols) Q-values of all actions in states, unseen state-actions read as 0'''
+        values = np.zeros((len(states), self.num_cols))
+        for i, state in enumerate(states):
+            state = int(state) * self.num_cols
+            for action in range(self.num_cols):
+                values[i, action] = self.get(state + action, 0)
+        return values
+    
+    def update(self, state, symm_state, action, target, alpha):
+        '''Moves Q-value of state-action and its symmetrical state-action towards target'''
+        key = state * self.num_cols + int(action)
+        symm_key = symm_state * self.num_cols + self.num_cols-1-int(action)
+        self[key] += (alpha * (target - self[key]))
+        self[symm_key] += (alpha * (target - self[symm_key]))
+    
+    def update_batch(self, states, symm_states, actions, targets, alpha):
+        '''Moves Q-values of a batch of state-actions and their symmetrical state-actions towards targets'''
+        for state, symm_state, action, target in zip(states, symm_states, actions, targets):
+            # Transitions may come from other actors, so add unseen state-actions first
+            state, symm_state = int(state), int(symm_state)
+            self.action_values(state, symm_state, [action])
+            self.update(state, symm_state, action, target, alpha)
+    
+    def get_state(self):
+        '''Returns Q-table as arrays of keys and values (for checkpoints)'''
+        return {'keys': utils.key_array(self.keys()), 'values': np.array(list(self.values()))}
+    
+    def set_state(self, arrays):
+        '''Replaces Q-table with arrays returned by get_state'''
+        self.clear()
+        dict.update(self, zip(utils.key_list(arrays['keys']), arrays['values'].tolist()))
+
+class DenseQTable():
+    def __init__(self, num_cols, capacity=1024):
+        '''Q-table with one float32 row of action values per state, mirrored states folded onto one row'''
+        self.num_cols = num_cols
+        self.index = {}
+        self.values = np.zeros((capacity, num_cols), dtype=np.float32)
+    
+    def __len__(self):
+        '''Returns number of states stored'''
+        return len(self.index)
+    
+    def row(self, state, symm_state):
+        '''Returns row of canonical state (the smaller key) and whether actions must be mirrored to index it'''
+        mirrored = symm_state < state
+        if mirrored:
+            state = symm_state
+        row = self.index.get(state)
+        if row is None:
+            row = len(self.index)
+            # Double capacity when full
+            if row == len(self.values):
+                self.values = np.concatenate([self.values, np.zeros_like(self.values)])
+            self.index[state] = row
+        return row, mirrored
+    
+    def action_values(self, state, symm_state, actions):
+        '''Returns Q-values of actions in state, adding state if unseen'''
+        row, mirrored = self.row(state, symm_state)
+        actions = np.asarray(actions)
+        if mirrored:
+            actions = self.num_cols-1 - actions
+        return self.values[row, actions]
+    
+    def batch_values(self, states, symm_states):
+        '''Returns (len(states), num_cols) Q-values of all actions in states, unseen states read as 0'''
+        mirrored = np.asarray(symm_states) < np.asarray(states)
+        rows = np.empty(len(states), dtype=int)
+        for i, (state, symm_state) in enumerate(zip(states, symm_states)):
+            rows[i] = self.index.get(symm_state if mirrored[i] else state, -1)
+        
+        # Gather rows of canonical states, zeroing unseen states rather than adding them
+        values = self.values[rows]
+        values[rows < 0] = 0
+        values[mirrored] = values[mirrored, ::-1]
+        return values
+    
+    def update(self, state, symm_state, action, target, alpha):
+        '''Moves Q-value of state-action towards target'''
+        row, mirrored = self.row(state, symm_state)
+        action = int(action)
+        if mirrored:
+            action = self.num_cols-1 - action
+        self.values[row, action] += alpha * (target - self.values[row, action])
+        # A symmetrical state is its own mirror image, so the mirrored action is updated as well
+        symm_action = self.num_cols-1 - action
+        if state == symm_state and symm_action != action:
+            self.values[row, symm_action] += alpha * (target - self.values[row, symm_action])
+    
+    def update_batch(self, states, symm_states, actions, targets, alpha):
+        '''Moves Q-values of a batch of state-actions towards targets (repeated ones towards their mean target)'''
+        rows, mirrored = zip(*[self.row(state, symm_state) for state, symm_state in zip(states, symm_states)])
+        rows = np.array(rows)
+        actions = np.where(mirrored, self.num_cols-1 - np.asarray(actions), actions)
+        
+        # A symmetrical state is its own mirror image, so the mirrored action is updated as well
+        symm_actions = self.num_cols-1 - actions
+        symmetric = (np.asarray(states) == np.asarray(symm_states)) & (symm_actions != actions)
+        rows = np.concatenate([rows, rows[symmetric]])
+        actions = np.concatenate([actions, symm_actions[symmetric]])
+        targets = np.concatenate([targets, np.asarray(targets)[symmetric]])
+        
+        # Errors are taken before any update, so a state-action occurring k times moves by the mean of its k errors
+        errors = targets - self.values[rows, actions]
+        _, pairs, counts = np.unique(rows * self.num_cols + actions, return_inverse=True, return_counts=True)
+        np.add.at(self.values, (rows, actions), alpha * errors / counts[pairs])
+    
+    def get_state(self):
+        '''Returns Q-table as arrays of state keys and their rows of values (for checkpoints)'''
+        return {'keys': utils.key_array(self.index.keys()), 'values': self.values[:len(self.index)]}
+    
+    def set_state(self, arrays):
+        '''Replaces Q-table with arrays returned by get_state'''
+        self.index = {state: row for row, state in enumerate(utils.key_list(arrays['keys']))}
+        self.values = np.zeros((max(1024, 2 * len(self.index)), self.num_cols), dtype=np.float32)
+        self.values[:len(self.index)] = arrays['values']
+
+class LinearQTable():
+    def __init__(self, num_cols, num_rows, num_connect):
+        '''Linear Q-function: Q-values of all actions are one matrix product of weights and board features'''
+        self.num_cols = num_cols
+        self.num_connect = num_connect
+        # Base-3 digits of the state keys are the cells (0 empty, 1 'o', 2 'x'), decoded with object ints if too big
+        num_cells = num_rows * num_cols
+        key_dtype = np.int64 if 3 ** num_cells <= np.iinfo(np.int64).max else object
+        self.powers = np.array([3 ** i for i in range(num_cells)], dtype=key_dtype)
+        self.windows = utils.winning_windows(num_cols, num_rows, num_connect)
+        # One-hot planes of 'o' and 'x', open lines of each length for both players and a bias
+        self.num_features = 2 * num_cells + 2 * (num_connect - 1) + 1
+        self.weights = np.zeros((num_cols, self.num_features))
+    
+    def __len__(self):
+        '''Returns number of weights (independent of states seen)'''
+        return self.weights.size
+    
+    def features(self, states):
+        '''Returns (len(states), num_features) feature vectors of states'''
+        states = np.asarray(states, dtype=self.powers.dtype).reshape(-1, 1)
+        cells = ((states // self.powers) % 3).astype(np.int8)
+        o_disks, x_disks = cells == 1, cells == 2
+        
+        # Lines holding disks of only one player, counted per number of disks
+        o_lines = o_disks[:, self.windows].sum(axis=2)
+        x_lines = x_disks[:, self.windows].sum(axis=2)
+        lengths = np.arange(1, self.num_connect)
+        open_o = ((o_lines[:, :, None] == lengths) & (x_lines[:, :, None] == 0)).mean(axis=1)
+        open_x = ((x_lines[:, :, None] == lengths) & (o_lines[:, :, None] == 0)).mean(axis=1)
+        return np.hstack([o_disks, x_disks, open_o, open_x, np.ones((len(states), 1))])
+    
+    def action_values(self, state, symm_state, actions):
+        '''Returns Q-values of actions in state'''
+        return (self.weights @ self.features([state])[0])[actions]
+    
+    def batch_values(self, states, symm_states):
+        '''Returns (len(states), num_cols) Q-values of all actions in states'''
+        return self.features(states) @ self.weights.T
+    
+    def update(self, state, symm_state, action, target, alpha):
+        '''Moves Q-value of state-action and its symmetrical state-action towards target'''
+        self.update_batch([state], [symm_state], [action], np.array([target]), alpha)
+    
+    def update_batch(self, states, symm_states, actions, targets, alpha):
+        '''Moves Q-values of a batch of state-actions and their symmetrical state-actions towards targets'''
+        actions = np.asarray(actions)
+        # Symmetrical states train the mirrored actions, unless they are the same board and action
+        symmetric = (np.asarray(states) == np.asarray(symm_states)) & (actions == self.num_cols-1 - actions)
+        states = np.concatenate([states, np.asarray(symm_states)[~symmetric]])
+        actions = np.concatenate([actions, self.num_cols-1 - actions[~symmetric]])
+        targets = np.concatenate([targets, targets[~symmetric]])
+        
+        # Normalised gradient steps, so alpha is the fraction of the error corrected whatever the board size, taken one
+        # sample after another as the bias and line features shared by most samples would overshoot if summed
+        features = self.features(states)
+        norms = np.sum(features ** 2, axis=1)
+        for action, feature, target, norm in zip(actions, features, targets, norms):
+            weights = self.weights[action]
+            weights += alpha * (target - weights @ feature) / norm * feature
+    
+    def get_state(self):
+        '''Returns weights (for checkpoints)'''
+        return {'weights': self.weights}
+    
+    def set_state(self, arrays):
+        '''Replaces weights with arrays returned by get_state'''
+        self.weights = np.array(arrays['weights'], dtype=float)
+
+class ReplayBuffer():
+    def __init__(self, capacity, num_cols, key_dtype=np.int64):
+        '''Fixed-capacity ring buffer of transitions in numpy arrays, overwriting the oldest when full'''
+        self.capacity = capacity
+        self.size = 0
+        self.position = 0
+        # Keys of state and symmetrical state before and after each transition
+        self.states = np.zeros(capacity, dtype=key_dtype)
+        self.symm_states = np.zeros(capacity, dtype=key_dtype)
+        self.next_states = np.zeros(capacity, dtype=key_dtype)
+        self.next_symm_states = np.zeros(capacity, dtype=key_dtype)
+        self.actions = np.zeros(capacity, dtype=int)
+        self.rewards = np.zeros(capacity)
+        self.dones = np.zeros(capacity, dtype=bool)
+        # Actions available after each transition (to take the max over)
+        self.next_available = np.zeros((capacity, num_cols), dtype=bool)
+    
+    def __len__(self):
+        '''Returns number of transitions stored'''
+        return self.size
+    
+    def add(self, state_t, action_t, reward, state_t1, done, next_available):
+        '''Stores one transition between (key, mirror key) states with the boolean mask of next available actions'''
+        i = self.position
+        self.states[i], self.symm_states[i] = state_t
+        self.next_states[i], self.next_symm_states[i] = state_t1
+        self.actions[i] = action_t
+        self.rewards[i] = reward
+        self.dones[i] = done
+        self.next_available[i] = next_available
+        self.position = (i + 1) % self.capacity
+        self.size = min(self.size + 1, self.capacity)
+    
+    def add_batch(self, states, symm_states, actions, rewards, next_states, next_symm_states, dones, next_available):
+        '''Stores many transitions at once (e.g. collected by other actors)'''
+        indices = (self.position + np.arange(len(actions))) % self.capacity
+        self.states[indices] = states
+        self.symm_states[indices] = symm_states
+        self.actions[indices] = actions
+        self.rewards[indices] = rewards
+        self.next_states[indices] = next_states
+        self.next_symm_states[indices] = next_symm_states
+        self.dones[indices] = dones
+        self.next_available[indices] = next_available
+        self.position = (self.position + len(actions)) % self.capacity
+        self.size = min(self.size + len(actions), self.capacity)
+    
+    def sample(self, batch_size):
+        '''Returns indices of batch_size transitions drawn uniformly with replacement'''
+        return np.random.randint(self.size, size=batch_size)
+    
+    def get_state(self):
+        '''Returns stored transitions and ring position as arrays (for checkpoints)'''
+        arrays = {name: getattr(self, name)[:self.size] for name in ['actions', 'rewards', 'dones', 'next_available']}
+        for name in ['states', 'symm_states', 'next_states', 'next_symm_states']:
+            arrays[name] = utils.key_array(getattr(self, name)[:self.size])
+        arrays['position'] = np.array(self.position)
+        return arrays
+    
+    def set_state(self, arrays):
+        '''Replaces stored transitions with arrays returned by get_state'''
+        self.size = len(arrays['actions'])
+        self.position = int(arrays['position'])
+        for name in ['actions', 'rewards', 'dones', 'next_available']:
+            getattr(self, name)[:self.size] = arrays[name]
+        for name in ['states', 'symm_states', 'next_states', 'next_symm_states']:
+            getattr(self, name)[:self.size] = utils.key_list(arrays[name])
+
 class LearningAgent(Agent):
-    def __init__(self, environment, alpha=0.1, epsilon=0.2, gamma=1):
-        '''Initializes all required variables'''
+    def __init__(self, environment, alpha=0.1, epsilon=0.2, gamma=1, q_table='dict',
+                 replay_capacity=None, batch_size=32, updates_per_step=1):
+        '''Initializes all required variables (learning from a replay buffer of replay_capacity transitions if given)'''
         super(LearningAgent, self).__init__(environment, alpha, epsilon)
         self.gamma = gamma
-        self.Q = {}
+        if q_table == 'dict':
+            self.Q = DictQTable(environment.num_cols)
+        elif q_table == 'dense':
+            self.Q = DenseQTable(environment.num_cols)
+        elif q_table == 'linear':
+            self.Q = LinearQTable(environment.num_cols, environment.num_rows, environment.num_connect)
+        else:
+            raise ValueError("The argument q_table has to be either 'dict', 'dense' or 'linear'.")
         self.opponent_rewards = []
+        
+        # Experience replay: batched updates from stored transitions instead of one update per step
+        self.replay = None
+        if replay_capacity is not None:
+            num_cells = environment.num_rows * environment.num_cols
+            key_dtype = np.int64 if 3 ** num_cells <= np.iinfo(np.int64).max else object
+            self.replay = ReplayBuffer(replay_capacity, environment.num_cols, key_dtype)
+        self.batch_size = batch_size
+        # Fractional ratios carry over, e.g. 0.25 makes one batch update every 4 steps
+        self.updates_per_step = updates_per_step
+        self.update_credit = 0
     
     def choose_move(self):
         '''Returns the chosen move under the e-greedy policy'''
-        # Generate Q-table key for state and symmetrical state
-        state_t = np.copy(self.environment.grid)
-        board_max_index = np.size(state_t, 1)-1
-        symm_state_t = np.array_str(np.flip(state_t, 1))
-        state_t = np.array_str(state_t)
+        # Keys of state and symmetrical state
+        state_t = self.environment.key
+        symm_state_t = self.environment.mirror_key
         
         chance = np.random.uniform(0,1)
         if (chance < self.epsilon):
-            # Generate state and symmetrical state key
-            action_t = self.random_move()
-            key = state_t + str(action_t)
-            symm_key = symm_state_t + str(board_max_index-action_t)
             # Add state-action to Q-table if new
-            if key not in self.Q:
-                self.Q[key] = 0
-            if symm_key not in self.Q:
-                self.Q[symm_key] = 0
+            action_t = self.random_move()
+            self.Q.action_values(state_t, symm_state_t, [action_t])
             return action_t
         
         else:
+            # Discover available states and find their Q-values
             available_actions = self.environment.available_actions
-            # Discover available states
-            for action in available_actions:
-                key = state_t + str(action)
-                symm_key = symm_state_t + str(board_max_index-action)
-                if key not in self.Q:
-                    self.Q[key] = 0
-                if symm_key not in self.Q:
-                    self.Q[symm_key] = 0
-                    
-            # Find max Q from state
-            max_Q = max(self.Q[state_t + str(action)] for action in available_actions)
+            values = self.Q.action_values(state_t, symm_state_t, available_actions)
             
-            # Choose random action that corresponds to max_Q
-            max_actions = []
-            for action in available_actions:
-                if (self.Q[state_t + str(action)] == max_Q):
-                    max_actions.append(action)
-                    
-            max_action = np.random.choice(max_actions)
+            # Choose random action that corresponds to max Q
+            max_action = np.random.choice(available_actions[values == values.max()])
             return max_action
     
+    def candidate_moves(self):
+        '''Returns the available moves with max Q, without adding unseen state-actions'''
+        available_actions = self.environment.available_actions
+        values = self.Q.batch_values([self.environment.key], [self.environment.mirror_key])[0, available_actions]
+        return available_actions[values == values.max()]
+    
     def learn(self, state_t, action_t, reward, state_t1):
         '''Updates Q-table accordingly to learn'''
-        # Convert state-action representation to string for Q-table key
-        board_max_index = np.size(state_t, 1)-1
+        # States are (key, mirror key) pairs of the environment
         available_actions = self.environment.available_actions
         
-        # Symmetrical variables
-        symm_state_t = np.array_str(np.flip(state_t, 1))
-        symm_state_t1 = np.array_str(np.flip(state_t1, 1))
-        symm_action_t = board_max_index-action_t
-        symm_update_key = symm_state_t + str(symm_action_t)
-        
-        # State variables
-        state_t = np.array_str(state_t)
-        state_t1 = np.array_str(state_t1)
-        update_key = state_t + str(action_t)
-        
+        if self.replay is not None:
+            # Store transition and learn from sampled ones instead
+            next_available = np.zeros(self.environment.num_cols, dtype=bool)
+            next_available[available_actions] = True
+            self.replay.add(state_t, action_t, reward, state_t1, self.environment.is_terminal, next_available)
+            self.learn_from_replay()
+            return
         
         # Discover new state-actions for state and symmetrical state
-        for action in available_actions:
-            # Generate keys
-            key = state_t1 + str(action)
-            symm_key = symm_state_t1 + str(board_max_index-action)
-            if key not in self.Q:
-                self.Q[key] = 0
-            if symm_key not in self.Q:
-                self.Q[symm_key] = 0
+        next_values = self.Q.action_values(state_t1[0], state_t1[1], available_actions)
                 
         # Check if terminal state
-        if self.environment.was_winning_move() or self.environment.grid_is_full():
+        if self.environment.is_terminal:
             factor = 0
         else:
             # Same value for both state and symmetrical state
-            factor = self.gamma * max([self.Q[state_t1 + str(action)] for action in available_actions])
+            factor = self.gamma * next_values.max()
         
         # Amend Q values for both states
-        self.Q[update_key] += (self.alpha * (reward + factor - self.Q[update_key]))
-        self.Q[symm_update_key] += (self.alpha * (reward + factor - self.Q[symm_update_key]))
+        self.Q.update(state_t[0], state_t[1], action_t, reward + factor, self.alpha)
+    
+    def learn_from_replay(self, num_transitions=1):
+        '''Runs the batch updates earned by num_transitions new transitions in the replay buffer'''
+        self.update_credit += self.updates_per_step * num_transitions
+        while self.update_credit >= 1:
+            self.update_credit -= 1
+            if len(self.replay) >= self.batch_size:
+                self.learn_batch(self.replay.sample(self.batch_size))
+    
+    def learn_batch(self, indices):
+        '''Updates Q-table from the replay buffer transitions at indices in one batch'''
+        replay = self.replay
+        self.learn_transitions(replay.states[indices], replay.symm_states[indices], replay.actions[indices],
+                               replay.rewards[indices], replay.next_states[indices], replay.next_symm_states[indices],
+                               replay.dones[indices], replay.next_available[indices])
+    
+    def learn_transitions(self, states, symm_states, actions, rewards, next_states, next_symm_states, dones,
+                          next_available):
+        '''Updates Q-table from a batch of transitions given as arrays (in the layout of ReplayBuffer)'''
+        # Max Q of next states over their available actions, 0 for terminal states
+        next_values = self.Q.batch_values(next_states, next_symm_states)
+        next_values[~next_available] = -np.inf
+        next_values = np.where(dones, 0, next_values.max(axis=1))
+        
+        targets = rewards + self.gamma * next_values
+        self.Q.update_batch(states, symm_states, actions, targets, self.alpha)
+    
+    def choose_moves(self, batch_environment):
+        '''Returns the chosen move under the e-greedy policy for every board of a BatchConnect'''
+        available = batch_environment.available_actions
+        values = self.Q.batch_values(batch_environment.keys, batch_environment.mirror_keys)
+        values[~available] = -np.inf
+        
+        # Choose random action among those with max Q
+        max_actions = values == values.max(axis=1, keepdims=True)
+        greedy_actions = (np.random.uniform(0, 1, size=values.shape) * max_actions).argmax(axis=1)
+        
+        # Explore with probability epsilon
+        explore = np.random.uniform(0, 1, size=len(values)) < self.epsilon
+        return np.where(explore, self.random_moves(batch_environment), greedy_actions)
 
 class RandomAgent(Agent):
     def __init__(self, environment):
@@ -117,13 +436,80 @@ class RandomAgent(Agent):
         '''Returns a random available move'''
         return self.random_move()
     
-def test(agent, episodes=10):
-    '''Performs policy evaluation over given number of episodes'''
+    def candidate_moves(self):
+        '''Returns all available moves'''
+        return self.environment.available_actions
+    
+    def choose_moves(self, batch_environment):
+        '''Returns a random available move for every board of a BatchConnect'''
+        return self.random_moves(batch_environment)
+    
+def expected_value(agent, environment, values):
+    '''Returns exact expected reward of agent from a position with the random opponent at turn'''
+    # Positions are always reached with 'o' at turn, so the key identifies them
+    key = environment.key
+    if key in values:
+        return values[key]
+    
+    # Average over all opponent moves
+    total = 0
+    opponent_actions = environment.available_actions
+    for response in opponent_actions:
+        environment.act(action = response)
+        if environment.winner is not None:
+            total += -1
+        elif not environment.is_draw:
+            # Average over the moves the agent chooses from
+            environment.change_turn()
+            actions = agent.candidate_moves()
+            action_total = 0
+            for action in actions:
+                environment.act(action = action)
+                if environment.winner is not None:
+                    action_total += 1
+                elif not environment.is_draw:
+                    environment.change_turn()
+                    action_total += expected_value(agent, environment, values)
+                    environment.change_turn()
+                environment.undo(action = action)
+            total += action_total / len(actions)
+            environment.change_turn()
+        environment.undo(action = response)
+    
+    values[key] = total / len(opponent_actions)
+    return values[key]
+
+def expected_reward(agent, board=connect.BitConnect):
+    '''Returns exact expected reward per episode of greedy agent against a random first-moving opponent'''
+    # Save old values to allow continuation
+    old_epsilon = agent.epsilon
+    old_environment = agent.environment
+    # Sweep a board of the given class with the size of the agent's board
+    new_environment = board(old_environment.num_cols, old_environment.num_rows, old_environment.num_connect,
+                            verbose=False)
+    agent.environment = new_environment
+    agent.epsilon = 0 # Greedy action
+    new_environment.reset(first_player='o')
+    
+    # Memoized sweep over all positions the agent can reach
+    reward = expected_value(agent, new_environment, {})
+    
+    agent.epsilon = old_epsilon
+    agent.environment = old_environment
+    return reward
+
+def test(agent, episodes=10, board=connect.Connect, exact=False):
+    '''Performs policy evaluation over given number of episodes (exactly, as expected total reward, if exact)'''
+    if exact:
+        # Values do not depend on the board class, so sweep the fastest one at the size of the agent's board
+        agent.rewards.append(episodes * expected_reward(agent))
+        return agent
+    
     # Save old values to allow continuation
     old_epsilon = agent.epsilon
     old_environment = agent.environment
     # Set new values for policy evaluations
-    new_environment = connect.Connect(verbose=False)
+    new_environment = board(verbose=False)
     agent.environment = new_environment
     agent.epsilon = 0 # Greedy action
     opponent = RandomAgent(environment=new_environment)
@@ -139,22 +525,22 @@ def test(agent, episodes=10):
         new_environment.act(action = action_t)
         
         # Play episode until win or board is full
-        while not (new_environment.was_winning_move() or new_environment.grid_is_full()):
+        while not new_environment.is_terminal:
             # Take action from state
             new_environment.change_turn()
             action_t = agent.choose_move()
             new_environment.act(action = action_t)
             
             # Observe response
-            if new_environment.was_winning_move():
+            if new_environment.winner is not None:
                 reward = 1
-            elif new_environment.grid_is_full():
+            elif new_environment.is_draw:
                 reward = 0
             else:
                 response = opponent.choose_move()
                 new_environment.change_turn()
                 new_environment.act(action = response)
-                if new_environment.was_winning_move():
+                if new_environment.winner is not None:
                     reward = -1
                 else:
                     reward = 0
@@ -167,16 +553,30 @@ def test(agent, episodes=10):
     agent.environment = old_environment
     return agent
 
-def play(max_steps=30000, ver=False, n=1000):
+def play(max_steps=30000, ver=False, n=1000, board=connect.Connect, q_table='dict',
+         checkpoint_path=None, checkpoint_every=10000, resume=False, telemetry_path=None, exact=False,
+         replay_capacity=None, batch_size=32, updates_per_step=1):
     '''Allows agent to learn through interaction - policy improvement'''
     # Setup players and environment
     steps = 0
-    env = connect.Connect(verbose=ver)
+    env = board(verbose=ver)
     opponent = RandomAgent(environment=env)
-    agent = LearningAgent(environment=env)
+    agent = LearningAgent(environment=env, q_table=q_table, replay_capacity=replay_capacity,
+                          batch_size=batch_size, updates_per_step=updates_per_step)
+    
+    # Continue from checkpoint if asked to and one has been written
+    if resume and checkpoint_path is not None and os.path.exists(checkpoint_path):
+        steps = checkpoint.load_checkpoint(checkpoint_path, agent, opponent)
+    last_checkpoint = steps
+    telemetry = None if telemetry_path is None else checkpoint.TelemetryLog(telemetry_path)
     
     # Play all steps
     while steps <= max_steps:
+        # Save checkpoint between episodes
+        if checkpoint_path is not None and steps - last_checkpoint >= checkpoint_every:
+            checkpoint.save_checkpoint(checkpoint_path, agent, opponent, steps)
+            last_checkpoint = steps
+        
         # Reset environment
         env.reset(first_player='o')
         
@@ -185,36 +585,43 @@ def play(max_steps=30000, ver=False, n=1000):
         env.act(action = action_t)
         
         # Play episode until win or board is full - end at max steps
-        while not (env.was_winning_move() or env.grid_is_full()) and steps <= max_steps:
+        while not env.is_terminal and steps <= max_steps:
             # Take action from state
             env.change_turn()
-            state_t = np.copy(env.grid)
+            state_t = (env.key, env.mirror_key)
             action_t = agent.choose_move()
             env.act(action = action_t)
             
             # Observe response
-            if env.was_winning_move():
+            if env.winner is not None:
                 reward = 1
-            elif env.grid_is_full():
+            elif env.is_draw:
                 reward = 0
             else:
                 response = opponent.choose_move()
                 env.change_turn()
                 env.act(action = response)
-                if env.was_winning_move():
+                if env.winner is not None:
                     reward = -1
                 else:
                     reward = 0
             
-            state_t1 = np.copy(env.grid)
+            state_t1 = (env.key, env.mirror_key)
             # Update Q tables
             agent.learn(state_t, action_t, reward, state_t1)
                 
             # Keep track of steps taken
             if (steps % n) == 0:
                 # Play 10 episodes of policy evaluation
-                agent = test(agent, episodes=10)
-                opponent = test(opponent, episodes = 10)
+                agent = test(agent, episodes=10, board=board, exact=exact)
+                if exact and opponent.rewards:
+                    # Random policy never changes, so its exact value is only computed once
+                    opponent.rewards.append(opponent.rewards[-1])
+                else:
+                    opponent = test(opponent, episodes = 10, board=board, exact=exact)
+                if telemetry is not None:
+                    telemetry.write(steps, q_size=len(agent.Q), eval_reward=agent.rewards[-1],
+                                    opponent_eval_reward=opponent.rewards[-1])
             steps += 1
     
     # Save rewards for random agent and return single agent
@@ -0,0 +1,291 @@
+import argparse
+import atexit
+from multiprocessing import shared_memory
+import numpy as np
+import connect
+
+# Header of a solution table file: magic bytes, then int64 [num_cols, num_rows, num_connect, stochastic, size]
+MAGIC = b'CONNSOLV'
+HEADER_SIZE = len(MAGIC) + 5 * 8
+
+# Tables reading from shared memory blocks in this process, by block name, so every block is mapped only once
+_shared_tables = {}
+
+
+class SolutionTable:
+    def __init__(self, keys, values, num_cols, num_rows, num_connect, stochastic):
+        """
+        Read-only table with the value of every position of a fully solved game
+
+        Positions are stored once under their canonical key, the smaller of Connect.key and Connect.mirror_key,
+        as a sorted uint64 key array and a value array (int8 for minimax, float32 for expectiminimax values).
+        Lookups are a binary search, so the arrays can be memory-mapped straight from a file (load) or placed in
+        a shared memory block (share). Such tables are pickled as the path or block name, so worker processes
+        reattach to the same pages instead of receiving a copy.
+
+        :param keys: sorted uint64 array of canonical keys
+        :param values: value of each key, from the point of view of 'x' (with 'o' moving first)
+        """
+        self.keys = keys
+        self.values = values
+        self.num_cols = num_cols
+        self.num_rows = num_rows
+        self.num_connect = num_connect
+        self.stochastic = stochastic
+        # Where the arrays live, if not in private memory
+        self.path = None
+        self.shared_memory = None
+
+    def __reduce__(self):
+        if self.path is not None:
+            return SolutionTable.load, (self.path,)
+        if self.shared_memory is not None:
+            return SolutionTable.attach, (self.shared_memory.name,)
+        return SolutionTable, (self.keys, self.values, self.num_cols, self.num_rows, self.num_connect, self.stochastic)
+
+    def __len__(self):
+        return len(self.keys)
+
+    def lookup(self, key, mirror_key):
+        """
+        Return the value of the position with the given key and mirrored key
+
+        :raises KeyError: if the position is not in the table
+        """
+        key = min(key, mirror_key)
+        index = np.searchsorted(self.keys, key)
+        if index == len(self.keys) or self.keys[index] != key:
+            raise KeyError(key)
+        return self.values[index].item()
+
+    def batch_lookup(self, keys, mirror_keys):
+        """
+        Return the values of many positions at once, given arrays of their keys and mirrored keys
+
+        :raises KeyError: if any of the positions is not in the table
+        """
+        keys = np.minimum(np.asarray(keys, dtype=np.uint64), np.asarray(mirror_keys, dtype=np.uint64))
+        indices = np.searchsorted(self.keys, keys)
+        found = indices < len(self.keys)
+        found[found] = self.keys[indices[found]] == keys[found]
+        if not found.all():
+            raise KeyError(keys[~found][0].item())
+        return self.values[indices]
+
+    def value(self, board):
+        """
+        Return the value of the current position of a Connect or BitConnect board
+        """
+        return self.lookup(board.key, board.mirror_key)
+
+    def check(self, board, stochastic):
+        """
+        Raise a ValueError if the table was not solved for the dimensions of board and the given kind of opponent
+        """
+        if (self.num_cols, self.num_rows, self.num_connect) != (board.num_cols, board.num_rows, board.num_connect):
+            raise ValueError("The solution table was solved for a %dx%d board with %d to connect." %
+                             (self.num_cols, self.num_rows, self.num_connect))
+        if self.stochastic != stochastic:
+            raise ValueError("The solution table was solved for a%s opponent." %
+                             (" random" if self.stochastic else "n optimal"))
+
+    def best_action(self, board, player='x'):
+        """
+        Choose the action of player that leads to the child position with the highest value
+
+        The child keys are computed from the key weights of the board, so the board is neither copied nor changed.
+        Ties go to the lowest column, and a winning move is taken as soon as it is found.
+
+        :raises KeyError: if a child position is not in the table (the solver only covers games 'o' started)
+        """
+        action_value = -2
+        best_action = -1
+        for a in board.available_actions:
+            row = board.lowest_free_rows[a]
+            child_key = board.key + board.key_weights[player][row][a]
+            child_mirror_key = board.mirror_key + board.mirror_key_weights[player][row][a]
+            value = self.lookup(child_key, child_mirror_key)
+            if value > action_value:
+                action_value = value
+                best_action = a
+                if action_value == 1:
+                    break
+        return best_action
+
+    def to_bytes(self):
+        """
+        Return the table in the layout of its file: magic bytes, header, keys and values
+        """
+        header = np.array([self.num_cols, self.num_rows, self.num_connect, int(self.stochastic), len(self.keys)],
+                          dtype=np.int64)
+        return b''.join([MAGIC, header.tobytes(), np.ascontiguousarray(self.keys, dtype=np.uint64).tobytes(),
+                         np.ascontiguousarray(self.values, dtype=value_dtype(self.stochastic)).tobytes()])
+
+    def save(self, path):
+        """
+        Write the table to a binary file that load() can memory-map
+        """
+        with open(path, 'wb') as f:
+            f.write(self.to_bytes())
+
+    @classmethod
+    def load(cls, path):
+        """
+        Memory-map a table written by save(); the arrays are read-only and shared with other processes via the page cache
+        """
+        with open(path, 'rb') as f:
+            if f.read(len(MAGIC)) != MAGIC:
+                raise ValueError("%s is not a solution table file." % path)
+            num_cols, num_rows, num_connect, stochastic, size = np.frombuffer(f.read(5 * 8), dtype=np.int64)
+        stochastic = bool(stochastic)
+        keys = np.memmap(path, dtype=np.uint64, mode='r', offset=HEADER_SIZE, shape=(size,))
+        values = np.memmap(path, dtype=value_dtype(stochastic), mode='r', offset=HEADER_SIZE + 8 * size, shape=(size,))
+        table = cls(keys, values, int(num_cols), int(num_rows), int(num_connect), stochastic)
+        table.path = path
+        return table
+
+    def share(self):
+        """
+        Copy the table into a new shared memory block and return a table reading from it
+
+        The returned table owns the block: call unlink() on it once no process needs the table any more.
+        """
+        data = self.to_bytes()
+        memory = shared_memory.SharedMemory(create=True, size=len(data))
+        memory.buf[:len(data)] = data
+        return SolutionTable.from_buffer(memory)
+
+    @classmethod
+    def attach(cls, name):
+        """
+        Return a table reading from the shared memory block with the given name (made by share())
+
+        Meant for processes started by multiprocessing, which share the resource tracker of their parent. Other
+        processes register the block with their own tracker, which unlinks it when they exit.
+        """
+        if name not in _shared_tables:
+            cls.from_buffer(shared_memory.SharedMemory(name=name))
+        return _shared_tables[name]
+
+    @classmethod
+    def from_buffer(cls, memory):
+        """
+        Return a table reading from the arrays in a shared memory block laid out like a table file
+        """
+        if bytes(memory.buf[:len(MAGIC)]) != MAGIC:
+            raise ValueError("Shared memory block %s does not hold a solution table." % memory.name)
+        num_cols, num_rows, num_connect, stochastic, size = np.frombuffer(memory.buf, dtype=np.int64, count=5,
+                                                                          offset=len(MAGIC))
+        stochastic = bool(stochastic)
+        keys = np.frombuffer(memory.buf, dtype=np.uint64, count=size, offset=HEADER_SIZE)
+        values = np.frombuffer(memory.buf, dtype=value_dtype(stochastic), count=size, offset=HEADER_SIZE + 8 * size)
+        table = cls(keys, values, int(num_cols), int(num_rows), int(num_connect), stochastic)
+        table.shared_memory = memory
+        _shared_tables[memory.name] = table
+        return table
+
+    def close(self):
+        """
+        Unmap the shared memory block of the table, which can not be used afterwards
+        """
+        # The block can only be closed once no array points into it
+        self.keys = None
+        self.values = None
+        self.shared_memory.close()
+        _shared_tables.pop(self.shared_memory.name, None)
+
+    def unlink(self):
+        """
+        Free the shared memory block of a table made by share()
+        """
+        self.shared_memory.unlink()
+
+
+@atexit.register
+def close_shared_tables():
+    # Garbage collection at exit could otherwise close blocks before the arrays pointing into them are freed
+    for table in list(_shared_tables.values()):
+        table.close()
+
+
+def value_dtype(stochastic):
+    return np.float32 if stochastic else np.int8
+
+
+def solve(num_cols=5, num_rows=3, num_connect=3, stochastic=False):
+    """
+    Compute the value of every position that can be reached from the empty board
+
+    'o' moves first and 'x' maximises. 'o' minimises, or with stochastic=True plays uniformly at random (the
+    values StochasticMinmaxAgent computes). The search has no pruning, so every value is exact.
+
+    :return: a SolutionTable
+    """
+    if 3 ** (num_cols * num_rows) > 2 ** 64:
+        raise ValueError("Boards with more than 40 cells do not fit into 64-bit keys.")
+
+    board = connect.BitConnect(num_cols, num_rows, num_connect, verbose=False)
+    # The search changes turn before every move, so start with 'x' at turn to let 'o' play first
+    board.reset(first_player='x')
+    values = {}
+    solve_position(board, values, stochastic)
+
+    keys = np.array(sorted(values), dtype=np.uint64)
+    table_values = np.array([values[int(key)] for key in keys], dtype=value_dtype(stochastic))
+    return SolutionTable(keys, table_values, num_cols, num_rows, num_connect, stochastic)
+
+
+def solve_position(board, values, stochastic):
+    """
+    Recursively fill values (canonical key -> value) for board and all positions reachable from it
+    """
+    key = min(board.key, board.mirror_key)
+    if key in values:
+        return values[key]
+
+    # Check if node is terminal and reward last player
+    if board.winner is not None:
+        value = 1 if board.winner == 'x' else -1
+    elif board.is_draw:
+        value = 0
+    else:
+        board.change_turn()
+        child_values = []
+        for a in board.available_actions:
+            board.act(action=a)
+            child_values.append(solve_position(board, values, stochastic))
+            board.undo(action=a)
+
+        if board.player_at_turn == 'x':
+            value = max(child_values)
+        elif stochastic:
+            # Average child nodes (due to equal weightings)
+            value = sum(child_values) / len(child_values)
+        else:
+            value = min(child_values)
+        board.change_turn()
+
+    values[key] = value
+    return value
+
+
+def build_table(path, num_cols=5, num_rows=3, num_connect=3, stochastic=False):
+    """
+    Solve a game and write its solution table to path
+    """
+    table = solve(num_cols, num_rows, num_connect, stochastic)
+    table.save(path)
+    return table
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Solve a Connect game and write its solution table to a file.")
+    parser.add_argument('path')
+    parser.add_argument('--num-cols', type=int, default=5)
+    parser.add_argument('--num-rows', type=int, default=3)
+    parser.add_argument('--num-connect', type=int, default=3)
+    parser.add_argument('--stochastic', action='store_true', help="solve against a uniformly random opponent")
+    args = parser.parse_args()
+
+    table = build_table(args.path, args.num_cols, args.num_rows, args.num_connect, args.stochastic)
+    print("Solved", len(table), "positions.")
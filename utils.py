@@ -1,3 +1,4 @@
+import multiprocessing
 import numpy as np
 
 
@@ -55,4 +56,80 @@ def search_sequence_numpy(arr, seq):
     # Match up with the input sequence & get the matching starting indices.
     M = (arr[np.arange(Na-Nseq+1)[:, None] + r_seq] == seq).all(1)
 
-    return np.any(M)
\ No newline at end of file
+    return np.any(M)
+
+def key_weights(num_cols, num_rows, players=('o', 'x')):
+    """ Base-3 weights for incrementally hashing a board into an integer key.
+
+    Cell (row, col) is digit row * num_cols + col of the key, holding 0 when the cell is empty
+    and 1 or 2 for the first or second player. The mirrored key uses the column num_cols - 1 - col,
+    so it equals the key of the left-right flipped board.
+
+    Output
+    ------
+    Output : two dicts mapping each player to a [row][col] nested list of the amount that
+    player's disk in that cell adds to the key and to the mirrored key respectively.
+    """
+    weights = {}
+    mirror_weights = {}
+    for digit, player in enumerate(players, start=1):
+        weights[player] = [[digit * 3 ** (row * num_cols + col) for col in range(num_cols)]
+                           for row in range(num_rows)]
+        mirror_weights[player] = [[digit * 3 ** (row * num_cols + num_cols - 1 - col) for col in range(num_cols)]
+                                  for row in range(num_rows)]
+    return weights, mirror_weights
+
+
+def winning_windows(num_cols, num_rows, num_connect):
+    """ Enumerate every line of num_connect cells on a board.
+
+    Cells are indexed row * num_cols + col, as in a flattened (num_rows, num_cols) grid.
+
+    Output
+    ------
+    Output : 2D int array of shape (num_windows, num_connect), one row of cell indices per
+    horizontal, vertical, upward-diagonal and downward-diagonal line.
+    """
+    windows = []
+    steps = np.arange(num_connect)
+    for row_step, col_step in [(0, 1), (1, 0), (1, 1), (-1, 1)]:
+        for row in range(num_rows):
+            for col in range(num_cols):
+                rows = row + row_step * steps
+                cols = col + col_step * steps
+                if rows.min() >= 0 and rows.max() < num_rows and cols.max() < num_cols:
+                    windows.append(rows * num_cols + cols)
+    return np.array(windows, dtype=int).reshape(-1, num_connect)
+
+
+def key_array(keys):
+    """ Pack integer table keys into a numpy array that can be saved without pickling.
+
+    Output
+    ------
+    Output : uint64 array of the keys, or an array of their decimal strings when a key
+    does not fit into 64 bits (undo with key_list).
+    """
+    keys = list(keys)
+    try:
+        return np.array(keys, dtype=np.uint64)
+    except OverflowError:
+        return np.array([str(key) for key in keys])
+
+
+def key_list(array):
+    """ Unpack an array made by key_array into a list of Python ints. """
+    return [int(key) for key in array]
+
+
+def seeds(seed, runs):
+    """ Derive an independent RNG seed for every run from a single seed (None for fresh entropy). """
+    return [int(child.generate_state(1)[0]) for child in np.random.SeedSequence(seed).spawn(runs)]
+
+
+def run_all(function, arguments, workers=None):
+    """ Call function on every argument, fanning the calls out over a process pool if workers is given. """
+    if workers is None or workers <= 1:
+        return [function(argument) for argument in arguments]
+    with multiprocessing.Pool(workers) as pool:
+        return pool.map(function, arguments)